@@ -211,6 +211,54 @@ class AddNewTables:
             cursor.close()
             conn.close()
     
+    def update_conversation_contexts_table(self):
+        """Bring the ORM conversation_contexts table up to date if it exists"""
+        if not self.check_table_exists('conversation_contexts'):
+            logger.info("ℹ️ conversation_contexts table not created yet, skipping...")
+            return True
+        
+        conn = self.get_connection()
+        if not conn:
+            return False
+        
+        cursor = conn.cursor()
+        
+        try:
+            # Context expiry is computed by the database
+            cursor.execute('''
+                ALTER TABLE conversation_contexts
+                ALTER COLUMN expires_at SET DEFAULT now() + interval '30 minutes'
+            ''')
+            
+            # Search parameters are stored as JSONB
+            cursor.execute('''
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'conversation_contexts' AND column_name = 'search_params'
+            ''')
+            if cursor.fetchone()[0] != 'jsonb':
+                cursor.execute('''
+                    ALTER TABLE conversation_contexts
+                    ALTER COLUMN search_params TYPE JSONB USING search_params::jsonb
+                ''')
+            
+            # Expired-context purges filter on expires_at
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS ix_conversation_contexts_expires_at
+                ON conversation_contexts(expires_at)
+            ''')
+            
+            conn.commit()
+            logger.info("✅ conversation_contexts table updated successfully")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to update conversation_contexts table: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+            conn.close()
+    
     def insert_sample_airlines(self):
         """Insert sample airline data if airlines table is empty"""
         conn = self.get_connection()
@@ -358,12 +406,17 @@ class AddNewTables:
             logger.error("❌ Failed to add conversation_context table")
             return False
         
-        # Step 4: Insert sample airlines data
+        # Step 4: Update conversation_contexts table
+        if not self.update_conversation_contexts_table():
+            logger.error("❌ Failed to update conversation_contexts table")
+            return False
+        
+        # Step 5: Insert sample airlines data
         if not self.insert_sample_airlines():
             logger.error("❌ Failed to insert sample airlines")
             return False
         
-        # Step 5: Verify all tables exist
+        # Step 6: Verify all tables exist
         if not self.verify_tables():
             logger.error("❌ Table verification failed")
             return False
@@ -3,7 +3,8 @@ Database models for user authentication and chat history
 """
 from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, JSON
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql import func, text
 from database import Base
 import uuid
 from datetime import datetime
@@ -131,7 +132,7 @@ class ConversationContext(Base):
     # Context data
     context_type = Column(String(50), default="flight_search")  # flight_search, hotel_search, etc.
     original_query = Column(Text, nullable=False)
-    search_params = Column(JSON, nullable=False)  # Store flight search parameters
+    search_params = Column(JSONB, nullable=False)  # Store flight search parameters
 
     # Flight-specific context
     origin = Column(String(10), nullable=True)  # Airport code
@@ -142,7 +143,7 @@ class ConversationContext(Base):
 
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    expires_at = Column(DateTime(timezone=True), nullable=False)  # 30 minutes from creation
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True, server_default=text("now() + interval '30 minutes'"))  # 30 minutes from creation
     is_active = Column(Boolean, default=True)
 
     # Relationships
@@ -1,8 +1,9 @@
 """
 Database configuration and connection setup for PostgreSQL
 """
-from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy import create_engine, MetaData
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool
 import os
 from typing import Generator
 from dotenv import load_dotenv
@@ -12,6 +13,7 @@ load_dotenv()
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
+PROBE_CONNECT_TIMEOUT_SECONDS = 3  # Health probe fails fast instead of waiting on the OS TCP timeout
 
 # Create SQLAlchemy engine
 engine = create_engine(
@@ -67,10 +69,24 @@ def test_connection():
     Test database connection
     """
     try:
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT 1"))
-            print("✅ Database connection successful")
-            return True
+        # One-shot probe: a NullPool engine opens a single connection without touching the app pool
+        probe = create_engine(
+            DATABASE_URL,
+            poolclass=NullPool,
+            connect_args={"connect_timeout": PROBE_CONNECT_TIMEOUT_SECONDS}
+        )
+        try:
+            # Dialect-level ping on the DBAPI connection, skipping Core statement compilation
+            raw_connection = probe.raw_connection()
+            try:
+                if not probe.dialect.do_ping(raw_connection.dbapi_connection):
+                    raise RuntimeError("ping returned False")
+            finally:
+                raw_connection.close()
+        finally:
+            probe.dispose()
+        print("✅ Database connection successful")
+        return True
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
         return False
@@ -4,8 +4,8 @@ import json
 import logging
 import asyncio
 from typing import Dict, Any, Optional
+import httpx
 import openai
-import requests
 from dotenv import load_dotenv
 import os
 
@@ -20,7 +20,9 @@ class MultiAIHandlerV2:
         # Initialize OpenAI
         openai_api_key = os.getenv('OPENAI_API_KEY')
         if openai_api_key:
-            self.openai_client = openai.OpenAI(api_key=openai_api_key)
+            # Own async client: simple_utils imports this module at load, so its shared
+            # get_openai_client() cannot be imported here without a circular import
+            self.openai_client = openai.AsyncOpenAI(api_key=openai_api_key)
             self.openai_available = True
             self.logger.info("✅ OpenAI client initialized")
         else:
@@ -31,6 +33,8 @@ class MultiAIHandlerV2:
         gemini_api_key = os.getenv('GEMINI_API_KEY')
         if gemini_api_key:
             self.gemini_api_key = gemini_api_key
+            # One async client keeps the connection to Gemini alive across requests
+            self.http_client = httpx.AsyncClient(timeout=10)
             self.gemini_available = True
             self.logger.info("✅ Gemini API client initialized")
         else:
@@ -83,7 +87,7 @@ class MultiAIHandlerV2:
             Return ONLY the JSON, no other text.
             """
             
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -161,7 +165,7 @@ class MultiAIHandlerV2:
                 }
             }
             
-            response = requests.post(url, json=payload, timeout=10)
+            response = await self.http_client.post(url, json=payload)
             response.raise_for_status()
             
             result = response.json()
@@ -186,9 +190,11 @@ class MultiAIHandlerV2:
         
         self.logger.info(f"🔍 Multi-AI filter extraction for: '{query}'")
         
-        # Try both AI services
-        openai_result = await self.extract_filters_openai(query)
-        gemini_result = await self.extract_filters_gemini(query)
+        # Try both AI services concurrently (each returns {} on failure)
+        openai_result, gemini_result = await asyncio.gather(
+            self.extract_filters_openai(query),
+            self.extract_filters_gemini(query)
+        )
         
         # Compare results and return the best one
         if openai_result and gemini_result:
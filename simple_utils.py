@@ -4,13 +4,21 @@ Focus: Essential date parsing and OpenAI integration
 """
 
 import re
+import copy
+import hashlib
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+import string
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, FrozenSet, Tuple
+from dateutil.relativedelta import relativedelta
 import openai
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, func, select
 import os
 from dotenv import load_dotenv
 
@@ -21,9 +29,30 @@ load_dotenv()
 try:
     from multi_ai_handler_v2 import MultiAIHandlerV2
     from enhanced_airline_detector_postgres import EnhancedAirlineDetectorPostgres
-    
-    multi_ai_handler = MultiAIHandlerV2()
-    
+except ImportError:
+    MultiAIHandlerV2 = None
+    EnhancedAirlineDetectorPostgres = None
+    print("⚠️ Multi-AI handler or airline detector not available")
+
+
+@lru_cache(maxsize=None)
+def get_multi_ai_handler():
+    """Create the multi-AI handler on first use instead of at import time"""
+    return MultiAIHandlerV2() if MultiAIHandlerV2 else None
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str) -> "openai.AsyncOpenAI":
+    """Shared async OpenAI client per API key, so all handlers reuse one keep-alive connection pool"""
+    return openai.AsyncOpenAI(api_key=api_key)
+
+
+@lru_cache(maxsize=None)
+def get_airline_detector():
+    """Create the PostgreSQL airline detector (and its connection) on first use"""
+    if not EnhancedAirlineDetectorPostgres:
+        return None
+
     # Get database configuration from environment
     db_config = {
         'host': os.getenv('DB_HOST', 'localhost'),
@@ -32,19 +61,377 @@ try:
         'user': os.getenv('DB_USER', 'postgres'),
         'password': os.getenv('DB_PASSWORD', 'password')
     }
-    
-    airline_detector = EnhancedAirlineDetectorPostgres(db_config)
+    return EnhancedAirlineDetectorPostgres(db_config)
+
+# Redis cache for conversation context (optional)
+REDIS_SOCKET_TIMEOUT_SECONDS = 0.3  # A slow or unreachable Redis must not stall the request
+REDIS_RETRY_AFTER_SECONDS = 30  # After a Redis error, go straight to the database for this long
+
+try:
+    import redis
+
+    redis_url = os.getenv('REDIS_URL')
+    redis_client = redis.Redis.from_url(
+        redis_url,
+        decode_responses=True,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS
+    ) if redis_url else None
 except ImportError:
-    multi_ai_handler = None
-    airline_detector = None
-    print("⚠️ Multi-AI handler or airline detector not available")
+    redis_client = None
+    print("⚠️ Redis not available, conversation context will be read from database")
+
+# Faster JSON parsing for OpenAI and cached responses (optional)
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+    print("⚠️ orjson not available, using standard json parser")
+
+CONTEXT_TTL_SECONDS = 1800  # Matches the 30-minute context expiration
+EXPIRED_PURGE_BATCH_SIZE = 1000  # Rows deleted per transaction when purging expired contexts
+FOLLOW_UP_CACHE_TTL_SECONDS = 5  # Absorbs UI retries of the same query (classification only)
+EXTRACTION_CACHE_TTL_SECONDS = 900  # Parsed OpenAI results reused for identical queries
+FILTER_MAX_TOKENS = 150  # Filter-only JSON is smaller than the full parameter set
+BULK_BATCH_SIZE = 20  # Queries per bulk extraction call, keeps the reply within the output token limit
+BULK_TOKENS_PER_QUERY = 200  # Same budget as a single parameter extraction
+
+
+_MISSING = object()  # Cache-miss sentinel, so None can be cached
+
+
+class TTLCache:
+    """Small in-process cache whose entries expire a fixed number of seconds after being set"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: Dict[Any, tuple] = {}
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return default
+        return value
+
+    def set(self, key, value):
+        # Re-insert so the oldest entry is always first in line for eviction
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.maxsize:
+            self._entries.pop(next(iter(self._entries)), None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+
+def _keyword_pattern(keywords) -> re.Pattern:
+    """Compile keywords into one alternation so a query is scanned once per category"""
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+# Punctuation becomes whitespace so "tomorrow?" tokenizes to "tomorrow"
+_PUNCT = str.maketrans({c: ' ' for c in string.punctuation})
+
+
+def _tokenize(query_lower: str) -> FrozenSet[str]:
+    """Split a lowercased query into its set of words"""
+    return frozenset(query_lower.translate(_PUNCT).split())
+
+
+class KeywordMatcher:
+    """Whole-word keywords are checked against the query's token set; phrases with spaces or punctuation via one regex"""
+
+    def __init__(self, keywords):
+        self.words = frozenset(k for k in keywords if k.isalnum())
+        phrases = frozenset(keywords) - self.words
+        self.phrase_re = _keyword_pattern(phrases) if phrases else None
+
+    def matches(self, tokens: FrozenSet[str], query_lower: str) -> bool:
+        if not self.words.isdisjoint(tokens):
+            return True
+        return bool(self.phrase_re and self.phrase_re.search(query_lower))
+
+    def count(self, tokens: FrozenSet[str], query_lower: str) -> int:
+        """Number of distinct keywords present in the query"""
+        hits = len(self.words & tokens)
+        if self.phrase_re:
+            hits += len(set(self.phrase_re.findall(query_lower)))
+        return hits
+
+
+# City to airport code mapping
+CITY_MAP = {
+    'delhi': 'DEL', 'mumbai': 'BOM', 'bangalore': 'BLR', 'chennai': 'MAA',
+    'kolkata': 'CCU', 'hyderabad': 'HYD', 'pune': 'PNQ', 'ahmedabad': 'AMD',
+    'kochi': 'COK', 'goa': 'GOI', 'jaipur': 'JAI', 'lucknow': 'LKO',
+    # Airport codes
+    'del': 'DEL', 'bom': 'BOM', 'blr': 'BLR', 'maa': 'MAA', 'ccu': 'CCU',
+    'hyd': 'HYD', 'pnq': 'PNQ', 'amd': 'AMD', 'cok': 'COK', 'goi': 'GOI',
+    # Common misspellings
+    'deli': 'DEL', 'dehli': 'DEL', 'mumbay': 'BOM', 'bombay': 'BOM',
+    'bangalor': 'BLR', 'banglore': 'BLR', 'chenai': 'MAA', 'channai': 'MAA',
+    'cochin': 'COK'
+}
+
+# Relative dates; TOMORROW_RE also covers misspellings like "tommorow", "tomorow", "tomarow"
+TOMORROW_RE = re.compile(r'\btom+[ao]r+ow\b')
+NEXT_WEEK_RE = re.compile(r'\bnext\s+week\b')
+NEXT_MONTH_RE = re.compile(r'\bnext\s+month\b')
+
+# Whole-word city matching, so "goa" does not match inside "goal"
+_CITY_RE = re.compile(r'\b(' + '|'.join(map(re.escape, sorted(CITY_MAP, key=len, reverse=True))) + r')\b')
+
+# Keyword sets for follow-up detection (built once at import)
+
+# Filter words that mean a city mention is part of a filter, not a route
+ROUTE_FILTER_KEYWORDS = frozenset([
+    'only', 'show only', 'just', 'merely', 'simply', 'exclusively',
+    'air india', 'indigo', 'vistara', 'spicejet', 'go first',
+    'direct', 'non-stop', 'business class', 'economy class',
+    'under', 'less than', 'cheaper than', 'morning', 'evening', 'afternoon'
+])
+
+DATE_KEYWORDS = frozenset([
+    'tomorrow', 'today', 'next week', 'next month', 'monday', 'tuesday',
+    'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+    'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december',
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+    # Tomorrow variants
+    'tommorow', 'tomorow', 'tommorrow', 'tomorrrow', 'tomarow'
+])
+
+# Follow-up change phrases that should never be read as a complete route
+CHANGE_PHRASES = frozenset([
+    'change destination to', 'change to', 'destination to', 'change origin to',
+    'origin to', 'go to', 'fly to'
+])
+
+# Filters that turn a route-less, date-less query into a filter change
+FILTER_CHANGE_KEYWORDS = frozenset([
+    'air india', 'indigo', 'vistara', 'spicejet', 'go first', 'direct', 'non-stop',
+    'business class', 'economy class', 'first class', 'premium', 'under', 'cheaper',
+    'morning', 'evening', 'afternoon', 'no', 'exclude', 'prefer', 'only', 'shows only'
+])
+
+FILTER_ONLY_KEYWORDS = frozenset([
+    'direct', 'business', 'economy', 'premium', 'first class',
+    'air india', 'indigo', 'vistara', 'spicejet', 'go first',
+    'under', 'less than', 'cheaper than', 'morning', 'evening', 'afternoon',
+    'no', 'exclude', 'prefer', 'preferably', 'maximum', 'max'
+])
+
+RESET_PATTERNS = frozenset([
+    "new search", "new query", "start over", "reset", "clear",
+    "forget", "ignore previous", "fresh search", "new conversation",
+    "start again", "begin new", "new flight search", "clear history",
+    "forget everything", "start fresh", "new request", "different search"
+])
+
+_ROUTE_FILTER_MATCH = KeywordMatcher(ROUTE_FILTER_KEYWORDS)
+_DATE_KEYWORD_MATCH = KeywordMatcher(DATE_KEYWORDS)
+_CHANGE_PHRASE_RE = _keyword_pattern(CHANGE_PHRASES)
+_FILTER_CHANGE_MATCH = KeywordMatcher(FILTER_CHANGE_KEYWORDS)
+_FILTER_ONLY_MATCH = KeywordMatcher(FILTER_ONLY_KEYWORDS)
+_RESET_RE = re.compile(r'\b(' + '|'.join(map(re.escape, sorted(RESET_PATTERNS, key=len, reverse=True))) + r')\b')
+
+# Date patterns like "July 8", "2025-07-08", "7/8/2025", "18th"
+_DATE_PATTERN_RE = re.compile(
+    r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+    r'|\d{4}-\d{1,2}-\d{1,2}'
+    r'|\d{1,2}(st|nd|rd|th)'
+    r'|(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}'
+    r'|(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+\d{1,2}',
+    re.IGNORECASE
+)
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    """Route/date/filter features of a query, extracted in one pass"""
+    has_route: bool
+    has_date: bool
+    has_complete_route: bool
+    cities_found: FrozenSet[str]  # Airport codes
+    tokens: FrozenSet[str]
+    has_filter_change: bool
+    has_filter_only: bool
+
+
+def _extract_features(query_lower: str) -> QueryFeatures:
+    """Scan a lowercased query once for everything follow-up detection branches on"""
+    tokens = _tokenize(query_lower)
+    cities_found = frozenset(CITY_MAP[city] for city in _CITY_RE.findall(query_lower))
+    has_route_pattern = 'from' in query_lower and 'to' in query_lower
+
+    # 🔧 FIX: Exclude filter-only queries that might contain city names
+    # If query contains filter keywords and no explicit route pattern, it's likely a filter
+    if _ROUTE_FILTER_MATCH.matches(tokens, query_lower) and not has_route_pattern:
+        has_route = False
+    else:
+        has_route = bool(cities_found) or has_route_pattern
+
+    # 🔧 FIX: Don't treat follow-up change phrases as complete routes
+    has_complete_route = (
+        not _CHANGE_PHRASE_RE.search(query_lower)
+        and (has_route_pattern or len(cities_found) >= 2)
+    )
+
+    return QueryFeatures(
+        has_route=has_route,
+        has_date=_DATE_KEYWORD_MATCH.matches(tokens, query_lower) or bool(_DATE_PATTERN_RE.search(query_lower)),
+        has_complete_route=has_complete_route,
+        cities_found=cities_found,
+        tokens=tokens,
+        has_filter_change=_FILTER_CHANGE_MATCH.matches(tokens, query_lower),
+        has_filter_only=_FILTER_ONLY_MATCH.matches(tokens, query_lower)
+    )
+
+
+@lru_cache(maxsize=4096)
+def _resolve_uid(user_id: str) -> int:
+    """Map an API user ID to the integer stored in conversation_contexts"""
+    # Guest users get a special ID (negative number to avoid conflicts)
+    if user_id == "guest_user":
+        return -1
+    # Authenticated users have numeric IDs; isdecimal() (not isdigit()) only accepts what int() can parse
+    if user_id.isdecimal() or (user_id[:1] == "-" and user_id[1:].isdecimal()):
+        return int(user_id)
+    # 🔧 FIX: Handle non-numeric user IDs gracefully
+    logging.getLogger(__name__).warning(f"⚠️ Non-numeric user ID: {user_id}, treating as guest")
+    return -1
+
 
 class ConversationMemory:
     """Manages conversation context and follow-up queries using database storage"""
 
+    # Follow-up patterns, checked in order (built once at import)
+    _FOLLOW_UP_PATTERNS = {
+        # Class changes
+        "business_class": [
+            "business class", "business", "show business", "business flights",
+            "premium", "upgrade", "first class", "economy plus",
+            "change to business", "make it business"
+        ],
+        "economy_class": [
+            "economy", "economy class", "show economy", "cheaper", "budget",
+            "change to economy", "make it economy", "economy instead"
+        ],
+        # Date modifications
+        "different_date": [
+            "different date", "another date", "other dates", "next day",
+            "day before", "earlier", "later", "weekend"
+        ],
+        # Passenger changes - IMPROVED
+        "more_passengers": [
+            "2 passengers", "3 passengers", "4 passengers", "family",
+            "add passenger", "more people", "add one more passenger",
+            "one more person", "add another passenger", "more passenger",
+            "add one more", "one more traveler"
+        ],
+        # Route changes - NEW
+        "destination_change": [
+            "change destination to", "destination to", "go to", "fly to",
+            "change to", "instead of"
+        ],
+        "origin_change": [
+            "change origin to", "origin to", "from", "start from",
+            "depart from", "leave from"
+        ],
+        # General modifications
+        "show_more": [
+            "show more", "more flights", "other options", "alternatives",
+            "different airlines", "more results"
+        ]
+    }
+    _FOLLOW_UP_MATCHERS = tuple(
+        (pattern_type, KeywordMatcher(patterns)) for pattern_type, patterns in _FOLLOW_UP_PATTERNS.items()
+    )
+
     def __init__(self, db: Session = None):
         self.db = db
         self.logger = logging.getLogger(__name__)
+        # user_id -> (query, follow-up type) for the user's latest query; the type depends on the
+        # query text alone, so it cannot go stale when another worker resets or replaces the context
+        self._follow_up_cache = TTLCache(maxsize=1024, ttl=FOLLOW_UP_CACHE_TTL_SECONDS)
+        # Monotonic time before which Redis is skipped after an error
+        self._redis_retry_at = 0.0
+
+    def _redis_available(self) -> bool:
+        """True when Redis is configured and not backing off after a recent error"""
+        return redis_client is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, action: str, error: Exception):
+        """Log a Redis error and skip Redis for a while so each request does not pay the timeout"""
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_AFTER_SECONDS
+        self.logger.warning(f"⚠️ Failed to {action} conversation context, using database only for {REDIS_RETRY_AFTER_SECONDS}s: {error}")
+
+    @staticmethod
+    def _context_cache_key(user_id: str) -> str:
+        # Same resolution as the database rows, so all IDs that share a row share the cache entry
+        return f"ctx:last:{_resolve_uid(user_id)}"
+
+    def _cache_last_search(self, user_id: str, last_search: Dict[str, Any], ttl: int = CONTEXT_TTL_SECONDS):
+        """Write the latest flight search context through to Redis"""
+        if ttl <= 0 or not self._redis_available():
+            return
+        timestamp = last_search.get("timestamp")
+        payload = dict(last_search, timestamp=timestamp.isoformat() if timestamp else None)
+        try:
+            redis_client.setex(
+                self._context_cache_key(user_id),
+                ttl,
+                json.dumps(payload, default=str)
+            )
+        except Exception as e:
+            self._redis_failed("cache", e)
+
+    def _get_cached_last_search(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Read the latest flight search context from Redis, None on miss"""
+        if not self._redis_available():
+            return None
+        try:
+            cached = redis_client.get(self._context_cache_key(user_id))
+            if not cached:
+                return None
+            last_search = _json_loads(cached)
+            # Return the same datetime the database path does
+            if last_search.get("timestamp"):
+                last_search["timestamp"] = datetime.fromisoformat(last_search["timestamp"])
+            return last_search
+        except Exception as e:
+            self._redis_failed("read cached", e)
+            return None
+
+    def _evict_cached_last_search(self, user_id: str):
+        """Drop the cached flight search context for a user"""
+        if not redis_client:
+            return
+        try:
+            redis_client.delete(self._context_cache_key(user_id))
+        except Exception as e:
+            self._redis_failed("evict cached", e)
+
+    @staticmethod
+    def _context_to_dict(context) -> Dict[str, Any]:
+        """Convert a ConversationContext row into the last-search structure"""
+        return {
+            "type": "flight_search",
+            "query": context.original_query,
+            "params": context.search_params,
+            "timestamp": context.created_at,
+            "origin": context.origin,
+            "destination": context.destination,
+            "departure_date": context.departure_date,
+            "passengers": context.passengers,
+            "cabin_class": context.cabin_class
+        }
 
     def store_flight_search(self, user_id: str, search_params: Dict[str, Any], query: str, db: Session):
         """Store successful flight search for follow-up queries in database"""
@@ -55,33 +442,28 @@ class ConversationMemory:
             # Clean up expired contexts first
             self._cleanup_expired_contexts(user_id, db)
 
-            # Create new context
-            expires_at = datetime.utcnow() + timedelta(minutes=30)  # 30-minute expiration
-
-            # Handle guest users vs authenticated users
-            if user_id == "guest_user":
-                # For guest users, use a special ID (negative number to avoid conflicts)
-                db_user_id = -1
-            else:
-                db_user_id = int(user_id)
+            # Create new context (expires_at defaults to 30 minutes out on the database side)
+            db_user_id = _resolve_uid(user_id)
 
             context = ConversationContext(
                 user_id=db_user_id,
                 context_type="flight_search",
                 original_query=query,
-                search_params=search_params.copy(),
+                search_params=search_params,
                 origin=search_params.get("origin"),
                 destination=search_params.get("destination"),
                 departure_date=search_params.get("departure_date"),
                 passengers=search_params.get("passengers", 1),
-                cabin_class=search_params.get("cabin_class", "ECONOMY"),
-                expires_at=expires_at
+                cabin_class=search_params.get("cabin_class", "ECONOMY")
             )
 
             db.add(context)
             db.commit()
             db.refresh(context)
 
+            # Write-through so the next turn can skip the database
+            self._cache_last_search(user_id, self._context_to_dict(context))
+
             # Keep only last 5 contexts per user
             self._limit_user_contexts(user_id, db)
 
@@ -94,45 +476,38 @@ class ConversationMemory:
     def get_last_flight_search(self, user_id: str, db: Session) -> Optional[Dict[str, Any]]:
         """Get the most recent flight search context from database"""
         try:
+            # Serve from Redis when possible; the TTL mirrors the DB expiration
+            cached = self._get_cached_last_search(user_id)
+            if cached:
+                return cached
+
             # Import here to avoid circular imports
             from auth_models import ConversationContext
 
             # Clean up expired contexts first
             self._cleanup_expired_contexts(user_id, db)
 
-            # Handle guest users vs authenticated users
-            if user_id == "guest_user":
-                db_user_id = -1
-            else:
-                # 🔧 FIX: Handle non-numeric user IDs gracefully
-                try:
-                    db_user_id = int(user_id)
-                except ValueError:
-                    self.logger.warning(f"⚠️ Non-numeric user ID: {user_id}, treating as guest")
-                    db_user_id = -1
+            db_user_id = _resolve_uid(user_id)
 
-            # Get most recent active flight search context
-            context = db.query(ConversationContext).filter(
+            # Get most recent active flight search context, with its remaining lifetime by the database clock
+            row = db.query(
+                ConversationContext,
+                func.extract("epoch", ConversationContext.expires_at - func.now()).label("remaining_seconds")
+            ).filter(
                 and_(
                     ConversationContext.user_id == db_user_id,
                     ConversationContext.context_type == "flight_search",
                     ConversationContext.is_active == True,
-                    ConversationContext.expires_at > datetime.utcnow()
+                    ConversationContext.expires_at > func.now()
                 )
             ).order_by(ConversationContext.created_at.desc()).first()
 
-            if context:
-                return {
-                    "type": "flight_search",
-                    "query": context.original_query,
-                    "params": context.search_params,
-                    "timestamp": context.created_at,
-                    "origin": context.origin,
-                    "destination": context.destination,
-                    "departure_date": context.departure_date,
-                    "passengers": context.passengers,
-                    "cabin_class": context.cabin_class
-                }
+            if row:
+                context, remaining_seconds = row
+                last_search = self._context_to_dict(context)
+                # Backfill the cache for the remaining lifetime of the row, never longer than a fresh context
+                self._cache_last_search(user_id, last_search, min(int(remaining_seconds), CONTEXT_TTL_SECONDS))
+                return last_search
 
             return None
 
@@ -145,21 +520,12 @@ class ConversationMemory:
         try:
             from auth_models import ConversationContext
 
-            # Handle guest users vs authenticated users
-            if user_id == "guest_user":
-                db_user_id = -1
-            else:
-                # 🔧 FIX: Handle non-numeric user IDs gracefully
-                try:
-                    db_user_id = int(user_id)
-                except ValueError:
-                    self.logger.warning(f"⚠️ Non-numeric user ID in cleanup: {user_id}, treating as guest")
-                    db_user_id = -1
+            db_user_id = _resolve_uid(user_id)
 
             db.query(ConversationContext).filter(
                 and_(
                     ConversationContext.user_id == db_user_id,
-                    ConversationContext.expires_at <= datetime.utcnow()
+                    ConversationContext.expires_at <= func.now()
                 )
             ).update({"is_active": False})
 
@@ -174,15 +540,7 @@ class ConversationMemory:
         try:
             from auth_models import ConversationContext
 
-            # 🔧 FIX: Handle non-numeric user IDs gracefully
-            if user_id == "guest_user":
-                db_user_id = -1
-            else:
-                try:
-                    db_user_id = int(user_id)
-                except ValueError:
-                    self.logger.warning(f"⚠️ Non-numeric user ID in limit contexts: {user_id}, treating as guest")
-                    db_user_id = -1
+            db_user_id = _resolve_uid(user_id)
 
             # Get all active contexts for user, ordered by creation date
             contexts = db.query(ConversationContext).filter(
@@ -206,251 +564,78 @@ class ConversationMemory:
 
     def detect_follow_up_query(self, query: str, user_id: str, db: Session) -> Optional[Dict[str, Any]]:
         """Detect if query is a follow-up to previous search"""
-        query_lower = query.lower().strip()
+        # Retries of the same query within a few seconds reuse the previous classification
+        cached = self._follow_up_cache.get(user_id, _MISSING)
+        if cached is not _MISSING and cached[0] == query:
+            follow_up_type = cached[1]
+        else:
+            follow_up_type = self._detect_follow_up_type(query, query.lower().strip(), user_id)
+            self._follow_up_cache.set(user_id, (query, follow_up_type))
 
-        # Get last flight search context from database
+        if not follow_up_type:
+            return None
+
+        # Only read the stored context once the query looks like a follow-up. It always comes from the
+        # shared Redis/database layer, so a reset or new search in any worker is seen immediately
         last_search = self.get_last_flight_search(user_id, db)
         if not last_search:
             return None
+        return {
+            "type": follow_up_type,
+            "last_search": last_search,
+            "original_query": query
+        }
+
+    def _detect_follow_up_type(self, query: str, query_lower: str, user_id: str) -> Optional[str]:
+        """Classify a query's follow-up type from its keywords alone (no database access)"""
+        feat = _extract_features(query_lower)
 
         # 🔧 FIX: If query has complete route information (origin + destination), treat as new query
         # This prevents over-aggressive follow-up detection for queries like "book 2 business class tickets from Mumbai to Goa"
-        if self._has_complete_route_info(query_lower):
+        if feat.has_complete_route:
             self.logger.info(f"🔄 Query has complete route info, treating as new query (not follow-up)")
             return None
 
         # Detect follow-up patterns
-        follow_up_patterns = {
-            # Class changes
-            "business_class": [
-                "business class", "business", "show business", "business flights",
-                "premium", "upgrade", "first class", "economy plus",
-                "change to business", "make it business"
-            ],
-            "economy_class": [
-                "economy", "economy class", "show economy", "cheaper", "budget",
-                "change to economy", "make it economy", "economy instead"
-            ],
-            # Date modifications
-            "different_date": [
-                "different date", "another date", "other dates", "next day",
-                "day before", "earlier", "later", "weekend"
-            ],
-            # Passenger changes - IMPROVED
-            "more_passengers": [
-                "2 passengers", "3 passengers", "4 passengers", "family",
-                "add passenger", "more people", "add one more passenger",
-                "one more person", "add another passenger", "more passenger",
-                "add one more", "one more traveler"
-            ],
-            # Route changes - NEW
-            "destination_change": [
-                "change destination to", "destination to", "go to", "fly to",
-                "change to", "instead of"
-            ],
-            "origin_change": [
-                "change origin to", "origin to", "from", "start from",
-                "depart from", "leave from"
-            ],
-            # General modifications
-            "show_more": [
-                "show more", "more flights", "other options", "alternatives",
-                "different airlines", "more results"
-            ]
-        }
-
-        detected_type = None
-        for pattern_type, patterns in follow_up_patterns.items():
-            if any(pattern in query_lower for pattern in patterns):
-                detected_type = pattern_type
-                break
-
-        if detected_type:
-            self.logger.info(f"🔄 Detected follow-up: {detected_type} for user {user_id}")
-            return {
-                "type": detected_type,
-                "last_search": last_search,
-                "original_query": query
-            }
+        for pattern_type, matcher in self._FOLLOW_UP_MATCHERS:
+            if matcher.matches(feat.tokens, query_lower):
+                self.logger.info(f"🔄 Detected follow-up: {pattern_type} for user {user_id}")
+                return pattern_type
 
         # 🔄 ENHANCED: Check if this is a route change query (has cities but no date)
         # This handles cases like "find flights for Delhi to Mumbai" after a previous search
-        if self._has_route_info(query_lower) and not self._has_date_info(query_lower):
+        if feat.has_route and not feat.has_date:
             self.logger.info(f"🔄 Detected route change without date for user {user_id}")
-            return {
-                "type": "route_change_same_date",
-                "last_search": last_search,
-                "original_query": query
-            }
+            return "route_change_same_date"
 
         # 🔄 NEW: Check if this is a date-only modification (has date but no route)
         # This handles cases like "for August 16" after a previous search
-        if self._has_date_info(query_lower) and not self._has_route_info(query_lower):
+        if feat.has_date and not feat.has_route:
             self.logger.info(f"🔄 Detected date-only modification for user {user_id}")
-            return {
-                "type": "date_change_same_route",
-                "last_search": last_search,
-                "original_query": query
-            }
+            return "date_change_same_route"
 
         # 🔄 NEW: Check if this is a filter-only modification (no route, no date, but has filters)
         # This handles cases like "air india flights only", "direct flights only", etc.
-        filter_keywords = [
-            'air india', 'indigo', 'vistara', 'spicejet', 'go first', 'direct', 'non-stop',
-            'business class', 'economy class', 'first class', 'premium', 'under', 'cheaper',
-            'morning', 'evening', 'afternoon', 'no ', 'exclude', 'prefer', 'only', 'shows only'
-        ]
-        
-        has_filter_keywords = any(keyword in query_lower for keyword in filter_keywords)
-        self.logger.info(f"🔍 DEBUG: Query '{query}' - has_filter_keywords: {has_filter_keywords}, has_route: {self._has_route_info(query_lower)}, has_date: {self._has_date_info(query_lower)}")
+        self.logger.info(f"🔍 DEBUG: Query '{query}' - has_filter_keywords: {feat.has_filter_change}, has_route: {feat.has_route}, has_date: {feat.has_date}")
         
-        if has_filter_keywords and not self._has_route_info(query_lower) and not self._has_date_info(query_lower):
+        if feat.has_filter_change and not feat.has_route and not feat.has_date:
             self.logger.info(f"🔄 Detected filter-only modification for user {user_id}")
-            return {
-                "type": "filter_change_same_route",
-                "last_search": last_search,
-                "original_query": query
-            }
+            return "filter_change_same_route"
 
         # 🔄 NEW: Check if this is a filter-only query (no route, no date, but has filters)
         # This handles cases like "air india flights only", "direct flights only", etc.
-        if not self._has_route_info(query_lower) and not self._has_date_info(query_lower):
+        if not feat.has_route and not feat.has_date:
             # Check if query contains filter keywords
-            filter_keywords = [
-                'direct', 'business', 'economy', 'premium', 'first class',
-                'air india', 'indigo', 'vistara', 'spicejet', 'go first',
-                'under', 'less than', 'cheaper than', 'morning', 'evening', 'afternoon',
-                'no ', 'exclude', 'prefer', 'preferably', 'maximum', 'max'
-            ]
-            
-            if any(keyword in query_lower for keyword in filter_keywords):
+            if feat.has_filter_only:
                 self.logger.info(f"🔄 Detected filter-only query for user {user_id}")
-                return {
-                    "type": "filter_only",
-                    "last_search": last_search,
-                    "original_query": query
-                }
+                return "filter_only"
 
         return None
 
-    def _has_route_info(self, query_lower: str) -> bool:
-        """Check if query contains route information (cities/airports)"""
-        cities = [
-            'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad',
-            'pune', 'ahmedabad', 'kochi', 'goa', 'jaipur', 'lucknow',
-            'del', 'bom', 'blr', 'maa', 'ccu', 'hyd', 'pnq', 'amd', 'cok', 'goi',
-            # Common misspellings
-            'deli', 'dehli', 'mumbay', 'bombay', 'bangalor', 'banglore',
-            'chenai', 'channai', 'cochin'
-        ]
-
-        # Check for "from X to Y" pattern or individual cities
-        has_cities = any(city in query_lower for city in cities)
-        has_route_pattern = 'from' in query_lower and 'to' in query_lower
-
-        # 🔧 FIX: Exclude filter-only queries that might contain city names
-        # If query contains filter keywords and no explicit route pattern, it's likely a filter
-        filter_keywords = [
-            'only', 'show only', 'just', 'merely', 'simply', 'exclusively',
-            'air india', 'indigo', 'vistara', 'spicejet', 'go first',
-            'direct', 'non-stop', 'business class', 'economy class',
-            'under', 'less than', 'cheaper than', 'morning', 'evening', 'afternoon'
-        ]
-        
-        has_filter_keywords = any(keyword in query_lower for keyword in filter_keywords)
-        
-        # If it has filter keywords but no explicit route pattern, treat as filter-only
-        if has_filter_keywords and not has_route_pattern:
-            return False
-
-        return has_cities or has_route_pattern
-
-    def _has_date_info(self, query_lower: str) -> bool:
-        """Check if query contains date information"""
-        date_keywords = [
-            'tomorrow', 'today', 'next week', 'next month', 'monday', 'tuesday',
-            'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
-            'january', 'february', 'march', 'april', 'may', 'june',
-            'july', 'august', 'september', 'october', 'november', 'december',
-            'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
-            # Tomorrow variants
-            'tommorow', 'tomorow', 'tommorrow', 'tomorrrow', 'tomarow'
-        ]
-
-        # Check for date patterns like "July 8", "2025-07-08", "18th", etc.
-        import re
-        date_patterns = [
-            r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',  # 7/8/2025, 07-08-2025
-            r'\d{4}-\d{1,2}-\d{1,2}',          # 2025-07-08
-            r'\d{1,2}(st|nd|rd|th)',           # 8th, 21st, 22nd, 23rd
-            r'(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}',  # July 8
-            r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\s+\d{1,2}'  # Jul 8
-        ]
-
-        has_date_keywords = any(keyword in query_lower for keyword in date_keywords)
-        has_date_patterns = any(re.search(pattern, query_lower, re.IGNORECASE) for pattern in date_patterns)
-
-        return has_date_keywords or has_date_patterns
-
-    def _has_complete_route_info(self, query_lower: str) -> bool:
-        """Check if query contains complete route information (both origin and destination)"""
-        
-        # 🔧 FIX: Don't treat follow-up change phrases as complete routes
-        change_phrases = [
-            'change destination to', 'change to', 'destination to', 'change origin to',
-            'origin to', 'go to', 'fly to'
-        ]
-        
-        # If query contains change phrases, it's likely a follow-up, not a complete route
-        if any(phrase in query_lower for phrase in change_phrases):
-            return False
-        
-        cities = [
-            'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad',
-            'pune', 'ahmedabad', 'kochi', 'goa', 'jaipur', 'lucknow',
-            'del', 'bom', 'blr', 'maa', 'ccu', 'hyd', 'pnq', 'amd', 'cok', 'goi',
-            # Common misspellings
-            'deli', 'dehli', 'mumbay', 'bombay', 'bangalor', 'banglore',
-            'chenai', 'channai', 'cochin'
-        ]
-
-        # Check for explicit "from X to Y" pattern (but not change phrases)
-        if 'from' in query_lower and 'to' in query_lower:
-            return True
-
-        # Count how many different cities are mentioned
-        cities_found = []
-        for city in cities:
-            if city in query_lower:
-                cities_found.append(city)
-
-        # If 2 or more different cities are mentioned, likely a complete route
-        if len(set(cities_found)) >= 2:
-            return True
-
-        return False
-
     def _extract_city_from_query(self, query: str) -> Optional[str]:
         """Extract city name from query and return airport code"""
-        query_lower = query.lower()
-        
-        # City to airport code mapping
-        city_map = {
-            'delhi': 'DEL', 'mumbai': 'BOM', 'bangalore': 'BLR', 'chennai': 'MAA',
-            'kolkata': 'CCU', 'hyderabad': 'HYD', 'pune': 'PNQ', 'ahmedabad': 'AMD',
-            'kochi': 'COK', 'goa': 'GOI', 'jaipur': 'JAI', 'lucknow': 'LKO',
-            # Common misspellings
-            'deli': 'DEL', 'dehli': 'DEL', 'mumbay': 'BOM', 'bombay': 'BOM',
-            'bangalor': 'BLR', 'banglore': 'BLR', 'chenai': 'MAA', 'channai': 'MAA',
-            'cochin': 'COK'
-        }
-        
-        # Look for cities in the query
-        for city, code in city_map.items():
-            if city in query_lower:
-                return code
-        
-        return None
+        match = _CITY_RE.search(query.lower())
+        return CITY_MAP[match.group(1)] if match else None
 
     def clear_conversation_context(self, user_id: str, db: Session) -> bool:
         """Clear all conversation context for a user to stop follow-up questions"""
@@ -458,12 +643,16 @@ class ConversationMemory:
             # Import here to avoid circular imports
             from auth_models import ConversationContext
 
-            # Delete all contexts for this user
-            deleted_count = db.query(ConversationContext).filter(
-                ConversationContext.user_id == int(user_id) if user_id != "guest_user" else -1
-            ).delete()
+            # Delete all contexts for this user in one statement; nothing in the session holds these rows
+            result = db.execute(
+                delete(ConversationContext)
+                .where(ConversationContext.user_id == _resolve_uid(user_id))
+                .execution_options(synchronize_session=False)
+            )
+            deleted_count = result.rowcount
             
             db.commit()
+            self._evict_cached_last_search(user_id)
             
             self.logger.info(f"🗑️ Cleared {deleted_count} conversation contexts for user {user_id}")
             return True
@@ -479,12 +668,24 @@ class ConversationMemory:
             # Import here to avoid circular imports
             from auth_models import ConversationContext
 
-            # Delete all expired contexts
-            deleted_count = db.query(ConversationContext).filter(
-                ConversationContext.expires_at < datetime.utcnow()
-            ).delete()
-            
-            db.commit()
+            # Delete expired contexts in bounded batches to keep locks and memory small
+            expired_ids = (
+                select(ConversationContext.id)
+                .where(ConversationContext.expires_at < func.now())
+                .limit(EXPIRED_PURGE_BATCH_SIZE)
+                .scalar_subquery()
+            )
+            deleted_count = 0
+            while True:
+                result = db.execute(
+                    delete(ConversationContext)
+                    .where(ConversationContext.id.in_(expired_ids))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                deleted_count += result.rowcount
+                if result.rowcount < EXPIRED_PURGE_BATCH_SIZE:
+                    break
             
             self.logger.info(f"🗑️ Cleared {deleted_count} expired conversation contexts")
             return deleted_count
@@ -496,16 +697,7 @@ class ConversationMemory:
 
     def is_reset_query(self, query: str) -> bool:
         """Check if query is asking to reset/clear conversation"""
-        query_lower = query.lower().strip()
-        
-        reset_patterns = [
-            "new search", "new query", "start over", "reset", "clear",
-            "forget", "ignore previous", "fresh search", "new conversation",
-            "start again", "begin new", "new flight search", "clear history",
-            "forget everything", "start fresh", "new request", "different search"
-        ]
-        
-        return any(pattern in query_lower for pattern in reset_patterns)
+        return _RESET_RE.search(query.lower()) is not None
 
 import logging
 import requests
@@ -514,7 +706,26 @@ logger = logging.getLogger(__name__)
 
 class SimpleDateParser:
     """Simple date parser for travel queries"""
-    
+
+    # Specific-day mentions like "august 12", "12 august", "august 12th"
+    _SPECIFIC_DAY_RE = re.compile(
+        r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(st|nd|rd|th)?\b'
+        r'|\b\d{1,2}\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b'
+    )
+
+    # "August 20 to August 29" and "20 August to 29 August"
+    _DATE_RANGE_PATTERNS = (
+        re.compile(r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})\s+to\s+(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})\b'),
+        re.compile(r'\b(\d{1,2})\s+(january|february|march|april|may|june|july|august|september|october|november|december)\s+to\s+(\d{1,2})\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b')
+    )
+
+    _DAY_NUMBER_RE = re.compile(r'\d{1,2}')
+
+    # "August 18", "Aug 20" - month name (full or abbreviated) followed by a day
+    _MONTH_DAY_RE = re.compile(
+        r'\b(january|jan|february|feb|march|mar|april|apr|may|june|jun|july|jul|august|aug|september|sep|october|oct|november|nov|december|dec)\s+(\d{1,2})'
+    )
+
     def __init__(self):
         # Month mappings
         self.months = {
@@ -530,42 +741,30 @@ class SimpleDateParser:
         today = datetime.now()  # Get current date each time
 
         # Handle relative dates (including common misspellings)
-        tomorrow_variants = ['tomorrow', 'tommorow', 'tomorow', 'tommorrow', 'tomorrrow', 'tomorow', 'tomarow']
-        if any(variant in query_lower for variant in tomorrow_variants):
+        if TOMORROW_RE.search(query_lower):
             date = today + timedelta(days=1)
             return date.strftime("%Y-%m-%d")
         
-        if 'next week' in query_lower:
+        if NEXT_WEEK_RE.search(query_lower):
             date = today + timedelta(days=7)
             return date.strftime("%Y-%m-%d")
 
-        if 'next month' in query_lower:
+        if NEXT_MONTH_RE.search(query_lower):
             # Calculate next month - if we're past the 15th, use 1st of next month
-            # If we're before the 15th, use 15th of next month for better user experience
-            next_month = today.replace(day=1) + timedelta(days=32)
-            next_month = next_month.replace(day=1)
-
-            # Use 15th of next month for better flight availability
-            if today.day <= 15:
-                try:
-                    next_month = next_month.replace(day=15)
-                except ValueError:
-                    # Handle months with less than 15 days (shouldn't happen, but safety)
-                    next_month = next_month.replace(day=1)
-
+            # If we're before the 15th, use 15th of next month for better flight availability
+            next_month = (today + relativedelta(months=1)).replace(day=15 if today.day <= 15 else 1)
             return next_month.strftime("%Y-%m-%d")
         
         # Handle specific dates like "August 18", "Aug 20", etc.
-        for month_name, month_num in self.months.items():
-            pattern = rf'{month_name}\s+(\d{{1,2}})'
-            match = re.search(pattern, query_lower)
-            if match:
-                day = int(match.group(1))
-                year = today.year
-                # If month has passed, use next year
-                if month_num < today.month:
-                    year += 1
-                return f"{year}-{month_num:02d}-{day:02d}"
+        match = self._MONTH_DAY_RE.search(query_lower)
+        if match:
+            month_num = self.months[match.group(1)]
+            day = int(match.group(2))
+            year = today.year
+            # If month has passed, use next year
+            if month_num < today.month:
+                year += 1
+            return f"{year}-{month_num:02d}-{day:02d}"
 
         # Return None if no date found - let the system handle inheritance
         return None
@@ -576,40 +775,24 @@ class SimpleDateParser:
         today = datetime.now()  # Get current date each time
 
         # Check if this is a specific date query (contains numbers indicating a specific day or relative dates)
-        import re
-
         # Check for relative date terms first (tomorrow, today, etc.)
-        tomorrow_variants = ['tomorrow', 'tommorow', 'tomorow', 'tommorrow', 'tomorrrow', 'tomorow', 'tomarow']
-        if any(variant in query_lower for variant in tomorrow_variants):
+        if TOMORROW_RE.search(query_lower):
             return {"type": "single_date", "date": self.parse_date(query)}
 
         if 'today' in query_lower or 'yesterday' in query_lower:
             return {"type": "single_date", "date": self.parse_date(query)}
 
         # Look for patterns like "august 12", "12 august", "august 12th", etc.
-        date_patterns = [
-            r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}\b',
-            r'\b\d{1,2}\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b',
-            r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\s+\d{1,2}(st|nd|rd|th)\b'
-        ]
-
-        for pattern in date_patterns:
-            if re.search(pattern, query_lower):
-                # This is a specific date query, not a month range query
-                return {"type": "single_date", "date": self.parse_date(query)}
+        if self._SPECIFIC_DAY_RE.search(query_lower):
+            # This is a specific date query, not a month range query
+            return {"type": "single_date", "date": self.parse_date(query)}
 
         # Check for "next month" queries first
-        if 'next month' in query_lower:
-            # Calculate next month range
-            next_month = today.replace(day=1) + timedelta(days=32)
-            next_month = next_month.replace(day=1)
-
+        if NEXT_MONTH_RE.search(query_lower):
             # Get first and last day of next month
+            next_month = (today + relativedelta(months=1)).replace(day=1)
             start_date = next_month
-            if next_month.month == 12:
-                end_date = datetime(next_month.year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(next_month.year, next_month.month + 1, 1) - timedelta(days=1)
+            end_date = next_month + relativedelta(months=1, days=-1)
 
             month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
                           'July', 'August', 'September', 'October', 'November', 'December']
@@ -631,17 +814,14 @@ class SimpleDateParser:
                 is_month_query = any(indicator in query_lower for indicator in month_indicators)
 
                 # Also check if the query is just asking about the month without specific dates
-                if is_month_query or (month_name in query_lower and not re.search(r'\d{1,2}', query_lower)):
+                if is_month_query or (month_name in query_lower and not self._DAY_NUMBER_RE.search(query_lower)):
                     year = today.year
                     if month_num < today.month:
                         year += 1
 
                     # Get first and last day of month
                     start_date = datetime(year, month_num, 1)
-                    if month_num == 12:
-                        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-                    else:
-                        end_date = datetime(year, month_num + 1, 1) - timedelta(days=1)
+                    end_date = start_date + relativedelta(months=1, days=-1)
 
                     return {
                         "type": "month_range",
@@ -656,17 +836,8 @@ class SimpleDateParser:
         """Parse date range queries like 'August 20 to August 29' or '20 August to 29 August'"""
         query_lower = query.lower()
         
-        # Pattern for "August 20 to August 29" or "20 August to 29 August"
-        date_range_patterns = [
-            r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})\s+to\s+(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{1,2})\b',
-            r'\b(\d{1,2})\s+(january|february|march|april|may|june|july|august|september|october|november|december)\s+to\s+(\d{1,2})\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b'
-        ]
-        
-        import re
-        from datetime import datetime
-        
-        for pattern in date_range_patterns:
-            match = re.search(pattern, query_lower)
+        for pattern in self._DATE_RANGE_PATTERNS:
+            match = pattern.search(query_lower)
             if match:
                 groups = match.groups()
                 
@@ -682,8 +853,10 @@ class SimpleDateParser:
                         end_day = int(groups[2])
                         end_month = groups[3]
                     
-                    # Get current year
-                    current_year = datetime.now().year
+                    # Read the clock once so year and month always agree (even across midnight on Dec 31)
+                    today = date.today()
+                    current_year = today.year
+                    current_month = today.month
                     
                     # Handle year transitions (e.g., December to January)
                     start_month_num = self.months[start_month]
@@ -694,7 +867,7 @@ class SimpleDateParser:
                     end_year = current_year
                     
                     # If start month is in the past, use next year
-                    if start_month_num < datetime.now().month:
+                    if start_month_num < current_month:
                         start_year += 1
                         end_year += 1
                     
@@ -715,45 +888,572 @@ class SimpleDateParser:
         
         return None
 
+# Keywords scored by SimpleOpenAIHandler.classify_query_type
+CLASSIFY_KEYWORDS = {
+    # Flight-related keywords
+    "flight": (
+        'flight', 'flights', 'fly', 'flying', 'travel', 'trip', 'journey',
+        'book', 'booking', 'ticket', 'tickets', 'airport', 'airline',
+        'departure', 'arrival', 'takeoff', 'landing'
+    ),
+    # Location keywords (Indian cities and common travel terms)
+    "location": (
+        'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad',
+        'pune', 'ahmedabad', 'kochi', 'goa', 'jaipur', 'lucknow',
+        'from', 'to', 'between', 'via'
+    ),
+    # Date/time keywords
+    "date": (
+        'today', 'tomorrow', 'yesterday', 'next week', 'next month',
+        'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+        'january', 'february', 'march', 'april', 'may', 'june',
+        'july', 'august', 'september', 'october', 'november', 'december'
+    )
+}
+
+_DIGITS_RE = re.compile(r'\d+')
+
+# Airlines recognised by the manual follow-up filter fallback, checked in order
+AIRLINE_FALLBACK = {
+    "qatar": "Qatar Airways",
+    "spicejet": "SpiceJet",
+    "emirates": "Emirates",
+    "air india": "Air India"
+}
+
+# Overlapping lookahead so every airline mention is seen, as with substring checks
+_AIRLINE_FALLBACK_RE = re.compile('(?=(' + _keyword_pattern(AIRLINE_FALLBACK).pattern + '))')
+
+# Suggestion triggers, matched at word starts ("trips" counts, "network" does not)
+_SUGGEST_RE = re.compile(
+    r'\b(?:(?P<delhi>delhi)|(?P<mumbai>mumbai)'
+    r'|(?P<leisure>vacation|holiday|trip)|(?P<business>business|work|meeting))'
+)
+
+# Example searches offered alongside general-query errors (shared, never mutated)
+_SUGGESTIONS_DELHI = (
+    "Search flights from Delhi to Mumbai tomorrow",
+    "Find flights from Delhi to Bangalore next week",
+    "Show flights from Delhi to Goa this weekend"
+)
+_SUGGESTIONS_MUMBAI = (
+    "Search flights from Mumbai to Delhi tomorrow",
+    "Find flights from Mumbai to Chennai next week",
+    "Show flights from Mumbai to Kochi in August"
+)
+_SUGGESTIONS_LEISURE = (
+    "Plan a trip: flights from Delhi to Goa next month",
+    "Weekend getaway: flights from Mumbai to Bangalore",
+    "Holiday flights: Delhi to Chennai in August"
+)
+_SUGGESTIONS_BUSINESS = (
+    "Business travel: flights from Delhi to Mumbai tomorrow",
+    "Quick trip: flights from Bangalore to Hyderabad today",
+    "Same-day return: flights from Chennai to Kochi"
+)
+_SUGGESTIONS_DEFAULT = (
+    "Search flights from Delhi to Mumbai tomorrow",
+    "Find flights from Bangalore to Chennai next week",
+    "Show flights from Kochi to Goa in August"
+)
+
+# Location-based suggestions first, then travel intent
+_SUGGESTIONS_BY_TRIGGER = (
+    ("delhi", _SUGGESTIONS_DELHI),
+    ("mumbai", _SUGGESTIONS_MUMBAI),
+    ("leisure", _SUGGESTIONS_LEISURE),
+    ("business", _SUGGESTIONS_BUSINESS)
+)
+
+
+_CLASSIFY_MATCHERS = {category: KeywordMatcher(keywords) for category, keywords in CLASSIFY_KEYWORDS.items()}
+
+
+@lru_cache(maxsize=4096)
+def _classify_scores(query_lower: str) -> tuple:
+    """(flight, location, date) keyword scores for a lowercased query"""
+    tokens = _tokenize(query_lower)
+    return tuple(_CLASSIFY_MATCHERS[category].count(tokens, query_lower) for category in ("flight", "location", "date"))
+
+
+@lru_cache(maxsize=4096)
+def _smart_suggestions(query_lower: str) -> Tuple[str, ...]:
+    """Example flight searches suited to a lowercased query"""
+    found = {match.lastgroup for match in _SUGGEST_RE.finditer(query_lower)}
+    for trigger, suggestions in _SUGGESTIONS_BY_TRIGGER:
+        if trigger in found:
+            return suggestions
+    return _SUGGESTIONS_DEFAULT
+
+
+# Replies to off-topic queries, first matching keyword set wins (inflections listed, tokens match whole words)
+_GENERAL_MESSAGES = (
+    (frozenset(['weather', 'temperature', 'temperatures', 'rain', 'rains', 'rainy', 'raining', 'rained', 'sunny']),
+     "I can't check weather, but I can help you find flights! Weather is important for travel planning."),
+    (frozenset(['joke', 'jokes', 'joking', 'funny', 'laugh', 'laughs', 'laughing']),
+     "I'm not a comedian, but I can make your travel planning fun! Let me find you great flight deals."),
+    (frozenset(['food', 'foods', 'cook', 'cooks', 'cooking', 'cooked', 'recipe', 'recipes',
+                'eat', 'eats', 'eating']),
+     "I can't help with cooking, but I can help you fly to places with amazing food!"),
+    (frozenset(['capital', 'capitals', 'country', 'countries', 'geography']),
+     "I can't answer geography questions, but I can help you fly to any capital city!")
+)
+
+
+# Sample Amadeus offers used to seed the PostgreSQL airline detector
+_SAMPLE_AMADEUS_FLIGHTS = (
+    {
+        "validatingAirlineCodes": ["QR"],
+        "itineraries": [{
+            "segments": [{
+                "carrierCode": "QR",
+                "operating": {"carrierCode": "Qatar Airways"}
+            }]
+        }]
+    },
+    {
+        "validatingAirlineCodes": ["SG"],
+        "itineraries": [{
+            "segments": [{
+                "carrierCode": "SG",
+                "operating": {"carrierCode": "SpiceJet"}
+            }]
+        }]
+    },
+    {
+        "validatingAirlineCodes": ["EK"],
+        "itineraries": [{
+            "segments": [{
+                "carrierCode": "EK",
+                "operating": {"carrierCode": "Emirates"}
+            }]
+        }]
+    },
+    {
+        "validatingAirlineCodes": ["AI"],
+        "itineraries": [{
+            "segments": [{
+                "carrierCode": "AI",
+                "operating": {"carrierCode": "Air India"}
+            }]
+        }]
+    }
+)
+
+# Airline names recognised by the local filter extractor
+_FILTER_AIRLINES = {
+    "air india": "Air India", "indigo": "IndiGo", "vistara": "Vistara", "spicejet": "SpiceJet",
+    "go first": "Go First", "goair": "Go First", "qatar": "Qatar Airways", "emirates": "Emirates"
+}
+_FILTER_AIRLINE_ALT = '|'.join(sorted(_FILTER_AIRLINES, key=len, reverse=True))
+# One or more airlines joined by commas, "or", "and", "nor", "/" or "&" (a negation or preference covers them all)
+_FILTER_AIRLINE_LIST = (
+    rf'(?:any\s+|the\s+)?(?:flights?\s+(?:on|with|by)\s+)?'
+    rf'(?:{_FILTER_AIRLINE_ALT})(?:\s*(?:,|/|&|\bor\b|\band\b|\bnor\b)\s*(?:{_FILTER_AIRLINE_ALT})\b)*'
+)
+
+# Fixed filter phrasings from FILTER_SYSTEM_PROMPT, matched locally before asking OpenAI
+FILTER_PATTERNS = {
+    "exclude_airlines": re.compile(
+        rf'\b(?:no|not|neither|exclude|excluding|without|avoid|avoiding|except(?:\s+for)?|other than|apart from)'
+        rf'\s+({_FILTER_AIRLINE_LIST})\b'
+    ),
+    "preferred_airlines": re.compile(rf'\b(?:prefer|preferably|preferred)\s+({_FILTER_AIRLINE_LIST})\b'),
+    "specific_airlines": re.compile(rf'\b({_FILTER_AIRLINE_ALT})\b'),
+    "direct_only": re.compile(r'\b(?:direct|non[-\s]?stop|no stops)\b'),
+    # Groups: currency prefix, amount, letters glued to the amount ("5k"), following word ("5 lakh")
+    "max_price": re.compile(
+        r'\b(?:under|less than|cheaper than|below)\s+(?:(rs\.?|inr|₹|\$|€|£|usd|eur)\s*)?'
+        r'(\d[\d,]*(?:\.\d+)?)([a-z]*)(?:\s+([a-z]+))?'
+    ),
+    "max_stops": re.compile(r'\bmax(?:imum)?\s+(\d)\s+stops?\b|\b(\d)\s+stops?\s+max(?:imum)?\b'),
+    "morning": re.compile(r'\bmorning\b'),
+    "afternoon": re.compile(r'\bafternoon\b'),
+    "evening": re.compile(r'\b(?:evening|night)\b')
+}
+
+# Negation cues; outside a recognised exclusion they could invert a filter, so OpenAI decides
+_NEGATION_RE = re.compile(
+    r"\b(?:no|not|non|never|neither|nor|without|avoid|avoiding|except|exclude|excluding|"
+    r"other than|apart from|don'?t|doesn'?t|won'?t|isn'?t)\b"
+)
+
+_ONLY_RE = re.compile(r'\b(?:only|just)\b')
+
+# Price units understood locally; anything in _UNKNOWN_PRICE_UNITS is left to OpenAI
+_PRICE_MULTIPLIERS = {
+    "k": 1_000, "thousand": 1_000,
+    "l": 100_000, "lac": 100_000, "lacs": 100_000, "lakh": 100_000, "lakhs": 100_000
+}
+_RUPEE_MARKERS = frozenset(["rs", "inr", "₹", "rupee", "rupees"])
+_UNKNOWN_PRICE_UNITS = frozenset([
+    "hundred", "m", "mn", "million", "cr", "crore", "crores", "bn", "billion",
+    "usd", "dollar", "dollars", "eur", "euro", "euros",
+    "h", "hr", "hrs", "hour", "hours", "min", "mins", "minutes", "stop", "stops"
+])
+
+
+def _parse_max_price(match: "re.Match") -> Optional[int]:
+    """Rupee amount for a max_price match, None when its currency or unit is not understood"""
+    currency, amount, glued_unit, next_word = match.groups()
+    if currency and currency.rstrip(".") not in _RUPEE_MARKERS:
+        return None
+
+    value = float(amount.replace(",", ""))
+    if glued_unit and glued_unit not in _RUPEE_MARKERS:
+        if glued_unit not in _PRICE_MULTIPLIERS:
+            return None
+        value *= _PRICE_MULTIPLIERS[glued_unit]
+    elif next_word in _PRICE_MULTIPLIERS:
+        value *= _PRICE_MULTIPLIERS[next_word]
+    elif next_word in _UNKNOWN_PRICE_UNITS:
+        return None
+    return int(value)
+
+
+# Checked in order, so "first class" wins over a stray "economy"
+CABIN_PATTERNS = (
+    ("FIRST", re.compile(r'\bfirst class\b')),
+    ("BUSINESS", re.compile(r'\bbusiness\b')),
+    ("ECONOMY", re.compile(r'\beconomy\b'))
+)
+
+
+def _match_filters(query_lower: str) -> Optional[Dict[str, Any]]:
+    """Build the filter-extraction JSON from fixed phrasings, None if nothing is recognised"""
+    filters = {
+        "direct_only": False,
+        "specific_airlines": [],
+        "max_price": None,
+        "preferred_times": [],
+        "exclude_airlines": [],
+        "max_stops": None,
+        "preferred_airlines": []
+    }
+
+    # Excluded or preferred airlines are not also "only" airlines
+    claimed = set()
+    resolved_spans = []
+    for key in ("exclude_airlines", "preferred_airlines"):
+        for match in FILTER_PATTERNS[key].finditer(query_lower):
+            resolved_spans.append(match.span())
+            for airline in FILTER_PATTERNS["specific_airlines"].findall(match.group(1)):
+                name = _FILTER_AIRLINES[airline]
+                if name not in filters[key]:
+                    filters[key].append(name)
+                claimed.add(name)
+    resolved_spans.extend(m.span() for m in FILTER_PATTERNS["direct_only"].finditer(query_lower))
+
+    # A negation the patterns above did not consume ("not direct", "don't want indigo") must not
+    # come back as its opposite, so leave the whole query to OpenAI
+    for negation in _NEGATION_RE.finditer(query_lower):
+        if not any(start <= negation.start() and negation.end() <= end for start, end in resolved_spans):
+            return None
+    for airline in FILTER_PATTERNS["specific_airlines"].findall(query_lower):
+        name = _FILTER_AIRLINES[airline]
+        if name not in claimed and name not in filters["specific_airlines"]:
+            filters["specific_airlines"].append(name)
+
+    # Exclusions mixed with "only" airlines ("no indigo, vistara only") are ambiguous to split locally
+    if filters["exclude_airlines"] and (filters["specific_airlines"] or _ONLY_RE.search(query_lower)):
+        return None
+    matched = bool(claimed or filters["specific_airlines"])
+
+    if FILTER_PATTERNS["direct_only"].search(query_lower):
+        # Same pair SYSTEM_PROMPT asks OpenAI for ("no stops", "non-stop", "direct" = max_stops 0)
+        filters["direct_only"] = True
+        filters["max_stops"] = 0
+        matched = True
+
+    price = FILTER_PATTERNS["max_price"].search(query_lower)
+    if price:
+        filters["max_price"] = _parse_max_price(price)
+        if filters["max_price"] is None:
+            # e.g. "under $300" or "under 2 hours": let OpenAI interpret it
+            return None
+        matched = True
+
+    stops = FILTER_PATTERNS["max_stops"].search(query_lower)
+    if stops:
+        filters["max_stops"] = int(stops.group(1) or stops.group(2))
+        matched = True
+
+    for period in ("morning", "afternoon", "evening"):
+        if FILTER_PATTERNS[period].search(query_lower):
+            filters["preferred_times"].append(period)
+            matched = True
+
+    # Default cabin mirrors the schema OpenAI is asked to fill
+    cabin_class = "ECONOMY"
+    for cabin, pattern in CABIN_PATTERNS:
+        if pattern.search(query_lower):
+            cabin_class = cabin
+            matched = True
+            break
+
+    if not matched:
+        return None
+    return {"filters": filters, "cabin_class": cabin_class}
+
+
+# Generic booking vocabulary; a query made only of these words names no place, airline or date
+_GENERIC_FLIGHT_WORDS = frozenset([
+    'i', 'im', 'me', 'my', 'we', 'us', 'our', 'you', 'can', 'could', 'would', 'will', 'is', 'are', 'there',
+    'a', 'an', 'the', 'some', 'any', 'please', 'pls', 'plz', 'hi', 'hello', 'hey', 'thanks',
+    'want', 'wanna', 'need', 'like', 'help', 'with', 'for', 'to', 'from', 'and', 'or', 'of', 'on', 'in',
+    'book', 'booking', 'find', 'search', 'show', 'get', 'give', 'see', 'check', 'look', 'looking', 'list',
+    'flight', 'flights', 'fly', 'flying', 'ticket', 'tickets', 'plane', 'air', 'airfare', 'fare', 'fares',
+    'trip', 'travel', 'journey', 'cheap', 'cheapest', 'best', 'good', 'available', 'options', 'new',
+    'one', 'way', 'return', 'round', 'economy', 'business', 'class'
+])
+
+
+def _lacks_flight_details(query_lower: str) -> bool:
+    """True when every word is generic booking vocabulary, so there is no place, airline or date to extract"""
+    tokens = _tokenize(query_lower)
+    return bool(tokens) and tokens <= _GENERIC_FLIGHT_WORDS
+
+
+def _parse_iso_date(value: str) -> date:
+    """Parse a %Y-%m-%d date, slicing the usual zero-padded form and using strptime for the rest"""
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return date(int(value[:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            pass
+    # Unpadded replies such as "2025-7-5" parse as before; invalid dates still raise ValueError
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _date_out_of_range(today: date, openai_date: date) -> bool:
+    """True when a departure date is in the past or more than two years ahead"""
+    return openai_date < today or openai_date > today + timedelta(days=730)
+
+
+# Relative date terms OpenAI tends to resolve wrongly; group names key _REL_HANDLERS
+_REL_DATE_RE = re.compile(
+    r'(?P<tomorrow>\btom+[ao]r+ow\b)|(?P<next_week>\bnext\s+week\b)|(?P<next_month>\bnext\s+month\b)'
+)
+
+# Term -> check(today, openai_date, custom_date) that is True when OpenAI's date should be replaced
+_REL_HANDLERS = {
+    "tomorrow": lambda today, od, cd: od != today + timedelta(days=1),
+    # Allow some flexibility for "next week" (5-9 days)
+    "next_week": lambda today, od, cd: not 5 <= (od - today).days <= 9,
+    # Without a custom date to compare months against, fall back to the range check
+    "next_month": lambda today, od, cd: (
+        (od.year, od.month) != (cd.year, cd.month) if cd else _date_out_of_range(today, od)
+    ),
+}
+
+
+# System prompt for flight parameter extraction (built once at import)
+SYSTEM_PROMPT = """
+You are a flight search assistant. Extract flight search parameters from user queries.
+
+IMPORTANT: Handle spelling mistakes intelligently. Common misspellings to recognize:
+- "tommorow", "tommorrow", "tomorow", "tomorrrow", "tomarow" = "tomorrow"
+- "deli", "dehli" = "Delhi"
+- "mumbay", "bombay" = "Mumbai"
+- "bangalor", "banglore" = "Bangalore"
+- "chenai", "channai" = "Chennai"
+- "kochi", "cochin" = "Kochi"
+
+Return ONLY valid JSON with these fields:
+{
+    "origin": "airport_code",
+    "destination": "airport_code",
+    "departure_date": "YYYY-MM-DD",
+    "passengers": 1,
+    "cabin_class": "ECONOMY",
+    "filters": {
+        "direct_only": false,
+        "specific_airlines": [],
+        "max_price": null,
+        "preferred_times": [],
+        "exclude_airlines": [],
+        "max_stops": null,
+        "preferred_airlines": []
+    }
+}
+
+Airport codes:
+Delhi=DEL, Mumbai=BOM, Bangalore=BLR, Chennai=MAA, Kolkata=CCU,
+Hyderabad=HYD, Pune=PNQ, Ahmedabad=AMD, Kochi=COK, Goa=GOI
+
+For dates (today is 2025-07-04):
+- "tomorrow" or any misspelling = 2025-07-05
+- "today" = 2025-07-04
+- "next week" = 2025-07-11
+- "August 18" = 2025-08-18
+- "next month" = 2025-08-15
+
+CABIN CLASS DETECTION (CRITICAL):
+- ALWAYS check the entire query for cabin class keywords FIRST
+- If ANY of these words appear: "business class", "business", "business cabin", "premium economy", "premium", "business only", "only business" = set "cabin_class": "BUSINESS"
+- If ANY of these words appear: "first class", "first", "luxury", "first only", "only first" = set "cabin_class": "FIRST"
+- If ANY of these words appear: "economy class", "economy", "coach", "economy only", "only economy" = set "cabin_class": "ECONOMY"
+- If user says "show only business class" or "business class only" = MUST set "cabin_class": "BUSINESS"
+- If user says "show only economy class" or "economy class only" = MUST set "cabin_class": "ECONOMY"
+- Default to "ECONOMY" ONLY if NO cabin class keywords are found
+- IMPORTANT: When user explicitly requests a specific class, prioritize that over default
+
+ADVANCED FILTERS DETECTION:
+- "direct flights only", "direct only", "non-stop only", "no stops", "direct flights" = set "filters.direct_only": true
+- "show only direct flights" = set "filters.direct_only": true
+- "I want direct flights" = set "filters.direct_only": true
+- "only Air India", "Air India only", "show Air India flights" = set "filters.specific_airlines": ["Air India"]
+- "IndiGo flights only", "only IndiGo" = set "filters.specific_airlines": ["IndiGo"]
+- "Vistara flights", "show Vistara" = set "filters.specific_airlines": ["Vistara"]
+- "SpiceJet only", "only SpiceJet flights" = set "filters.specific_airlines": ["SpiceJet"]
+- "GoAir flights", "Go First flights" = set "filters.specific_airlines": ["Go First"]
+- "under 5000", "less than 5000", "cheaper than 5000" = set "filters.max_price": 5000
+- "under 10000 rupees", "less than 10000" = set "filters.max_price": 10000
+- "morning flights", "early morning", "before 10 AM" = set "filters.preferred_times": ["morning"]
+- "evening flights", "after 6 PM", "night flights" = set "filters.preferred_times": ["evening"]
+- "afternoon flights", "between 12 PM and 6 PM" = set "filters.preferred_times": ["afternoon"]
+- "no Air India", "exclude Air India" = set "filters.exclude_airlines": ["Air India"]
+- "not IndiGo", "exclude IndiGo" = set "filters.exclude_airlines": ["IndiGo"]
+- "maximum 1 stop", "max 1 stop", "1 stop maximum" = set "filters.max_stops": 1
+- "no stops", "non-stop", "direct" = set "filters.max_stops": 0
+- "prefer Air India", "preferably Air India" = set "filters.preferred_airlines": ["Air India"]
+- "prefer IndiGo", "preferably IndiGo" = set "filters.preferred_airlines": ["IndiGo"]
+
+SPECIAL HANDLING:
+- If query has cities but NO date mentioned, omit "departure_date" from response
+- If you cannot extract origin/destination, return {"error": "missing_location"}
+- Examples of queries without dates: "find flights for Delhi to Mumbai", "flights from Chennai to Kochi"
+- ALWAYS check for cabin class keywords in the query and set cabin_class accordingly
+- ALWAYS check for filter keywords and set appropriate filters
+
+EXAMPLES:
+- "direct flights from Delhi to Mumbai" → {"filters": {"direct_only": true}}
+- "show only Air India flights" → {"filters": {"specific_airlines": ["Air India"]}}
+- "flights under 5000 rupees" → {"filters": {"max_price": 5000}}
+- "morning flights only" → {"filters": {"preferred_times": ["morning"]}}
+- "no Air India flights" → {"filters": {"exclude_airlines": ["Air India"]}}
+- "maximum 1 stop" → {"filters": {"max_stops": 1}}
+- "prefer IndiGo" → {"filters": {"preferred_airlines": ["IndiGo"]}}
+- "business class direct flights only" → {"cabin_class": "BUSINESS", "filters": {"direct_only": true}}
+"""
+
+# System prompt for extracting several queries in one call (JSON mode needs an object, not an array)
+BULK_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+BATCH MODE: The user message is a JSON array of queries.
+Return ONLY a JSON object {"results": [...]} with one parameter object per input query, in the same order.
+"""
+
+# System prompt for follow-up filter-only extraction
+FILTER_SYSTEM_PROMPT = """
+You are a flight filter extraction assistant. Extract ONLY filters from the user query.
+
+Return ONLY valid JSON with these fields:
+{
+    "filters": {
+        "direct_only": false,
+        "specific_airlines": [],
+        "max_price": null,
+        "preferred_times": [],
+        "exclude_airlines": [],
+        "max_stops": null,
+        "preferred_airlines": []
+    },
+    "cabin_class": "ECONOMY"
+}
+
+FILTER DETECTION:
+- "air india flights only", "only air india" = specific_airlines: ["Air India"]
+- "indigo flights only", "only indigo" = specific_airlines: ["IndiGo"]
+- "vistara flights", "only vistara" = specific_airlines: ["Vistara"]
+- "spicejet only", "only spicejet" = specific_airlines: ["SpiceJet"]
+- "direct flights only", "direct only", "non-stop only" = direct_only: true
+- "under 5000", "less than 5000" = max_price: 5000
+- "morning flights", "early morning" = preferred_times: ["morning"]
+- "evening flights", "night flights" = preferred_times: ["evening"]
+- "no air india", "exclude air india" = exclude_airlines: ["Air India"]
+- "maximum 1 stop", "max 1 stop" = max_stops: 1
+- "prefer air india", "preferably air india" = preferred_airlines: ["Air India"]
+
+CABIN CLASS DETECTION:
+- "business class", "business" = cabin_class: "BUSINESS"
+- "economy class", "economy" = cabin_class: "ECONOMY"
+- "first class", "first" = cabin_class: "FIRST"
+
+Return ONLY the JSON, no other text.
+"""
+
+
 class SimpleOpenAIHandler:
     """Simple OpenAI integration for query processing"""
 
+    # Set once the airline detector has learned _SAMPLE_AMADEUS_FLIGHTS
+    _airline_detector_trained = False
+
     def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key)
         self.date_parser = SimpleDateParser()
         self.conversation_memory = ConversationMemory()
         self.logger = logging.getLogger(__name__)
+        # (mode, query hash) -> parsed JSON from OpenAI
+        self._extraction_cache = TTLCache(maxsize=2048, ttl=EXTRACTION_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def _extraction_cache_key(mode: str, query: str) -> Tuple[str, str]:
+        """Cache key for a query's parsed extraction, insensitive to case and outer whitespace"""
+        normalized = query.strip().lower()
+        return mode, hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+    async def _complete_json(self, system_prompt: str, content: str, max_tokens: int) -> Any:
+        """Send one chat completion in JSON mode and parse the reply"""
+        response = await self.client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
+            ],
+            temperature=0.1,
+            max_tokens=max_tokens,
+            # JSON mode: the reply is a bare JSON object, never wrapped in markdown fences
+            response_format={"type": "json_object"}
+        )
+        return _json_loads(response.choices[0].message.content)
+
+    async def _chat_json(self, mode: str, system_prompt: str, query: str, max_tokens: int = 200) -> Dict[str, Any]:
+        """Ask OpenAI for a JSON answer, reusing the parsed result for an identical recent query"""
+        cache_key = self._extraction_cache_key(mode, query)
+        cached = self._extraction_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"💾 Reusing cached {mode} extraction for query: '{query}'")
+            # Callers post-process the result in place
+            return copy.deepcopy(cached)
+
+        logger.info(f"🔄 Making OpenAI API call for {mode} extraction")
+        result = await self._complete_json(system_prompt, query, max_tokens)
+        self._extraction_cache.set(cache_key, copy.deepcopy(result))
+        return result
+
+    async def _chat_json_batch(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Extract parameters for several queries in one OpenAI call, warming the extraction cache"""
+        logger.info(f"🔄 Making OpenAI API call for bulk extraction of {len(queries)} queries")
+        response = await self._complete_json(
+            BULK_SYSTEM_PROMPT, json.dumps(queries), BULK_TOKENS_PER_QUERY * len(queries)
+        )
+
+        results = response.get("results") if isinstance(response, dict) else None
+        if not isinstance(results, list) or len(results) != len(queries) \
+                or not all(isinstance(params, dict) for params in results):
+            raise ValueError(f"bulk extraction returned a malformed result for {len(queries)} queries")
+
+        # Later single-query extractions of the same text skip the API call
+        for query, params in zip(queries, results):
+            if "error" not in params:
+                self._extraction_cache.set(self._extraction_cache_key("params", query), copy.deepcopy(params))
+        return results
 
     def classify_query_type(self, query: str) -> Dict[str, Any]:
         """Classify if query is flight-related or general"""
-        query_lower = query.lower()
-
-        # Flight-related keywords
-        flight_keywords = [
-            'flight', 'flights', 'fly', 'flying', 'travel', 'trip', 'journey',
-            'book', 'booking', 'ticket', 'tickets', 'airport', 'airline',
-            'departure', 'arrival', 'takeoff', 'landing'
-        ]
-
-        # Location keywords (Indian cities and common travel terms)
-        location_keywords = [
-            'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad',
-            'pune', 'ahmedabad', 'kochi', 'goa', 'jaipur', 'lucknow',
-            'from', 'to', 'between', 'via'
-        ]
-
-        # Date/time keywords
-        date_keywords = [
-            'today', 'tomorrow', 'yesterday', 'next week', 'next month',
-            'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
-            'january', 'february', 'march', 'april', 'may', 'june',
-            'july', 'august', 'september', 'october', 'november', 'december'
-        ]
-
-        # Count matches
-        flight_score = sum(1 for keyword in flight_keywords if keyword in query_lower)
-        location_score = sum(1 for keyword in location_keywords if keyword in query_lower)
-        date_score = sum(1 for keyword in date_keywords if keyword in query_lower)
+        # Whole-word keyword matches per category ("fly" does not match "butterfly")
+        flight_score, location_score, date_score = _classify_scores(query.lower())
 
         total_score = flight_score + location_score + date_score
 
@@ -775,48 +1475,33 @@ class SimpleOpenAIHandler:
                 "suggestion": "I'm a flight search assistant. Try asking about flights between cities!"
             }
 
-    def get_smart_suggestions(self, query: str) -> List[str]:
+    def get_smart_suggestions(self, query: str) -> Tuple[str, ...]:
         """Generate smart flight suggestions based on user query context"""
-        query_lower = query.lower()
-
-        # Location-based suggestions
-        if 'delhi' in query_lower:
-            return [
-                "Search flights from Delhi to Mumbai tomorrow",
-                "Find flights from Delhi to Bangalore next week",
-                "Show flights from Delhi to Goa this weekend"
-            ]
-        elif 'mumbai' in query_lower:
-            return [
-                "Search flights from Mumbai to Delhi tomorrow",
-                "Find flights from Mumbai to Chennai next week",
-                "Show flights from Mumbai to Kochi in August"
-            ]
-        elif any(word in query_lower for word in ['vacation', 'holiday', 'trip']):
-            return [
-                "Plan a trip: flights from Delhi to Goa next month",
-                "Weekend getaway: flights from Mumbai to Bangalore",
-                "Holiday flights: Delhi to Chennai in August"
-            ]
-        elif any(word in query_lower for word in ['business', 'work', 'meeting']):
-            return [
-                "Business travel: flights from Delhi to Mumbai tomorrow",
-                "Quick trip: flights from Bangalore to Hyderabad today",
-                "Same-day return: flights from Chennai to Kochi"
-            ]
-        else:
-            return [
-                "Search flights from Delhi to Mumbai tomorrow",
-                "Find flights from Bangalore to Chennai next week",
-                "Show flights from Kochi to Goa in August"
-            ]
+        return _smart_suggestions(query.lower())
 
     def store_successful_search(self, user_id: str, search_params: Dict[str, Any], query: str, db: Session):
         """Store successful flight search for future follow-ups"""
         if user_id and db:
             self.conversation_memory.store_flight_search(user_id, search_params, query, db)
 
-    def handle_follow_up_query(self, follow_up_info: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _manual_airline_filters(query: str) -> Optional[Dict[str, Any]]:
+        """Airline-only filters from a plain keyword match, used when AI extraction fails"""
+        found = {AIRLINE_FALLBACK[keyword] for keyword in _AIRLINE_FALLBACK_RE.findall(query.lower())}
+        for airline in AIRLINE_FALLBACK.values():
+            if airline in found:
+                return {
+                    "specific_airlines": [airline],
+                    "direct_only": False,
+                    "max_price": None,
+                    "preferred_times": [],
+                    "exclude_airlines": [],
+                    "max_stops": None,
+                    "preferred_airlines": []
+                }
+        return None
+
+    async def handle_follow_up_query(self, follow_up_info: Dict[str, Any]) -> Dict[str, Any]:
         """Handle follow-up queries and inherit/modify parameters as needed"""
         follow_up_type = follow_up_info["type"]
         last_search = follow_up_info["last_search"]
@@ -834,36 +1519,18 @@ class SimpleOpenAIHandler:
                 "original_query": original_query
             }
             self.logger.info(f"🔄 Follow-up: Inherited route {inherited_params['origin']} → {inherited_params['destination']}")
-            # Extract filters from the original query using OpenAI
-            import asyncio
             try:
-                # Create a new event loop if one doesn't exist
-                try:
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # If we're already in an async context, we need to handle this differently
-                        self.logger.warning("⚠️ Cannot run async function in sync context, using fallback")
-                        filter_params = None
-                    else:
-                        filter_params = loop.run_until_complete(self._extract_filters_only(original_query))
-                except RuntimeError:
-                    # No event loop, create one
-                    filter_params = asyncio.run(self._extract_filters_only(original_query))
-                
-                self.logger.info(f"🔄 Filter extraction result: {filter_params}")
-                
-                # Use multi-AI handler for filter extraction (OpenAI + Gemini)
-                if multi_ai_handler:
+                # Common phrasings ("direct only", "only indigo") are resolved locally without any API call
+                local_filters = _match_filters(original_query.lower())
+                # Use multi-AI handler for filter extraction (OpenAI + Gemini) only when that fails
+                multi_ai_handler = get_multi_ai_handler() if local_filters is None else None
+                if local_filters is not None:
+                    inherited_params.update(local_filters)
+                    self.logger.info("🔄 Extracted follow-up filters locally: %s", local_filters)
+                elif multi_ai_handler:
                     self.logger.info(f"🤖 Using multi-AI handler for query: '{original_query}'")
                     try:
-                        # Try to run async function in sync context
-                        import asyncio
-                        import concurrent.futures
-                        
-                        # Use ThreadPoolExecutor to run async function
-                        with concurrent.futures.ThreadPoolExecutor() as executor:
-                            future = executor.submit(asyncio.run, multi_ai_handler.extract_filters_multi_ai(original_query))
-                            ai_filter_params = future.result()
+                        ai_filter_params = await multi_ai_handler.extract_filters_multi_ai(original_query)
                         
                         if ai_filter_params:
                             inherited_params.update(ai_filter_params)
@@ -875,49 +1542,15 @@ class SimpleOpenAIHandler:
                         self.logger.error(f"❌ Multi-AI handler error: {e}")
                         
                         # Try PostgreSQL airline detector as fallback
-                        if airline_detector:
+                        if EnhancedAirlineDetectorPostgres:
                             self.logger.info(f"🗄️ Trying PostgreSQL airline detector for query: '{original_query}'")
                             try:
-                                # Learn from sample data first
-                                sample_amadeus_flights = [
-                                    {
-                                        "validatingAirlineCodes": ["QR"],
-                                        "itineraries": [{
-                                            "segments": [{
-                                                "carrierCode": "QR",
-                                                "operating": {"carrierCode": "Qatar Airways"}
-                                            }]
-                                        }]
-                                    },
-                                    {
-                                        "validatingAirlineCodes": ["SG"],
-                                        "itineraries": [{
-                                            "segments": [{
-                                                "carrierCode": "SG",
-                                                "operating": {"carrierCode": "SpiceJet"}
-                                            }]
-                                        }]
-                                    },
-                                    {
-                                        "validatingAirlineCodes": ["EK"],
-                                        "itineraries": [{
-                                            "segments": [{
-                                                "carrierCode": "EK",
-                                                "operating": {"carrierCode": "Emirates"}
-                                            }]
-                                        }]
-                                    },
-                                    {
-                                        "validatingAirlineCodes": ["AI"],
-                                        "itineraries": [{
-                                            "segments": [{
-                                                "carrierCode": "AI",
-                                                "operating": {"carrierCode": "Air India"}
-                                            }]
-                                        }]
-                                    }
-                                ]
-                                airline_detector.learn_from_amadeus_response(sample_amadeus_flights)
+                                airline_detector = get_airline_detector()
+
+                                # Learn from sample data once per process (the detector persists it in PostgreSQL)
+                                if not SimpleOpenAIHandler._airline_detector_trained:
+                                    airline_detector.learn_from_amadeus_response(_SAMPLE_AMADEUS_FLIGHTS)
+                                    SimpleOpenAIHandler._airline_detector_trained = True
                                 
                                 detected_filters = airline_detector.detect_airlines(original_query)
                                 if detected_filters:
@@ -930,52 +1563,15 @@ class SimpleOpenAIHandler:
                                 self.logger.error(f"❌ PostgreSQL detector error: {pg_error}")
                         
                         # Final fallback to manual detection
-                        if "qatar" in original_query.lower():
-                            inherited_params["filters"] = {
-                                "specific_airlines": ["Qatar Airways"],
-                                "direct_only": False,
-                                "max_price": None,
-                                "preferred_times": [],
-                                "exclude_airlines": [],
-                                "max_stops": None,
-                                "preferred_airlines": []
-                            }
-                            self.logger.info("🔄 Applied manual fallback Qatar Airways filter")
-                        elif "spicejet" in original_query.lower():
-                            inherited_params["filters"] = {
-                                "specific_airlines": ["SpiceJet"],
-                                "direct_only": False,
-                                "max_price": None,
-                                "preferred_times": [],
-                                "exclude_airlines": [],
-                                "max_stops": None,
-                                "preferred_airlines": []
-                            }
-                            self.logger.info("🔄 Applied manual fallback SpiceJet filter")
-                        elif "emirates" in original_query.lower():
-                            inherited_params["filters"] = {
-                                "specific_airlines": ["Emirates"],
-                                "direct_only": False,
-                                "max_price": None,
-                                "preferred_times": [],
-                                "exclude_airlines": [],
-                                "max_stops": None,
-                                "preferred_airlines": []
-                            }
-                            self.logger.info("🔄 Applied manual fallback Emirates filter")
-                        elif "air india" in original_query.lower():
-                            inherited_params["filters"] = {
-                                "specific_airlines": ["Air India"],
-                                "direct_only": False,
-                                "max_price": None,
-                                "preferred_times": [],
-                                "exclude_airlines": [],
-                                "max_stops": None,
-                                "preferred_airlines": []
-                            }
-                            self.logger.info("🔄 Applied manual fallback Air India filter")
+                        manual_filters = self._manual_airline_filters(original_query)
+                        if manual_filters:
+                            inherited_params["filters"] = manual_filters
+                            self.logger.info(f"🔄 Applied manual fallback {manual_filters['specific_airlines'][0]} filter")
                 else:
                     self.logger.warning(f"⚠️ Multi-AI handler not available, using fallback.")
+                    # Extract filters from the original query using OpenAI
+                    filter_params = await self._extract_filters_only(original_query)
+                    self.logger.info(f"🔄 Filter extraction result: {filter_params}")
                     if filter_params:
                         inherited_params.update(filter_params)
                         self.logger.info(f"🔄 Added filters from follow-up: {filter_params}")
@@ -984,18 +1580,11 @@ class SimpleOpenAIHandler:
                         self.logger.warning(f"⚠️ No airline found in query: '{original_query.lower()}'")
             except Exception as e:
                 self.logger.error(f"❌ Error extracting filters: {e}")
-                # Fallback: manually extract SpiceJet filter
-                if "spicejet" in original_query.lower():
-                    inherited_params["filters"] = {
-                        "specific_airlines": ["SpiceJet"],
-                        "direct_only": False,
-                        "max_price": None,
-                        "preferred_times": [],
-                        "exclude_airlines": [],
-                        "max_stops": None,
-                        "preferred_airlines": []
-                    }
-                    self.logger.info("🔄 Applied fallback SpiceJet filter")
+                # Fallback: manually extract airline filter
+                manual_filters = self._manual_airline_filters(original_query)
+                if manual_filters:
+                    inherited_params["filters"] = manual_filters
+                    self.logger.info(f"🔄 Applied fallback {manual_filters['specific_airlines'][0]} filter")
             self.logger.info(f"🔄 Final inherited_params: {inherited_params}")
             return inherited_params
 
@@ -1012,11 +1601,10 @@ class SimpleOpenAIHandler:
 
         elif follow_up_type == "more_passengers":
             # Extract number from query
-            import re
-            numbers = re.findall(r'\d+', original_query)
-            if numbers:
-                new_params["passengers"] = int(numbers[0])
-                self.logger.info(f"🔄 Follow-up: Changing to {numbers[0]} passengers")
+            match = _DIGITS_RE.search(original_query)
+            if match:
+                new_params["passengers"] = int(match.group())
+                self.logger.info(f"🔄 Follow-up: Changing to {match.group()} passengers")
             else:
                 new_params["passengers"] = 2  # Default to 2 if no number found
 
@@ -1084,20 +1672,24 @@ class SimpleOpenAIHandler:
 
         return new_params
 
-    async def extract_flight_params(self, query: str, user_id: str = None, db: Session = None) -> Dict[str, Any]:
-        """Extract flight search parameters using OpenAI"""
+    async def extract_flight_params(self, query: str, user_id: str = None, db: Session = None,
+                                    prefetched_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Extract flight search parameters using OpenAI (pass prefetched_context to skip the context read)"""
         try:
             # Initialize follow-up metadata
             follow_up_metadata = None
             is_follow_up_query = False
+            # Last search context for this request, read from the store at most once
+            last_search = prefetched_context if prefetched_context is not None else _MISSING
 
             # Check for follow-up queries first - this takes priority over classification
             if user_id and db:
                 follow_up_info = self.conversation_memory.detect_follow_up_query(query, user_id, db)
                 if follow_up_info:
                     is_follow_up_query = True
-                    self.logger.info(f"🔄 Processing follow-up query: {follow_up_info['type']}")
-                    modified_params = self.handle_follow_up_query(follow_up_info)
+                    last_search = follow_up_info["last_search"]
+                    self.logger.info("🔄 Processing follow-up query: %s", follow_up_info["type"])
+                    modified_params = await self.handle_follow_up_query(follow_up_info)
 
                     # If handle_follow_up_query returns None, we need fresh parameter extraction
                     if modified_params is not None:
@@ -1108,7 +1700,7 @@ class SimpleOpenAIHandler:
                         return modified_params
                     else:
                         # Continue with fresh extraction but remember this is a follow-up
-                        self.logger.info(f"🔄 Follow-up requires fresh parameter extraction")
+                        self.logger.info("🔄 Follow-up requires fresh parameter extraction")
                         follow_up_metadata = {
                             "is_follow_up": True,
                             "follow_up_type": follow_up_info["type"],
@@ -1121,18 +1713,11 @@ class SimpleOpenAIHandler:
                 
                 if classification["type"] == "general_query":
                     # Provide context-aware responses based on query content
-                    query_lower = query.lower()
-
-                    if any(word in query_lower for word in ['weather', 'temperature', 'rain', 'sunny']):
-                        message = "I can't check weather, but I can help you find flights! Weather is important for travel planning."
-                    elif any(word in query_lower for word in ['joke', 'funny', 'laugh']):
-                        message = "I'm not a comedian, but I can make your travel planning fun! Let me find you great flight deals."
-                    elif any(word in query_lower for word in ['food', 'cook', 'recipe', 'eat']):
-                        message = "I can't help with cooking, but I can help you fly to places with amazing food!"
-                    elif any(word in query_lower for word in ['capital', 'country', 'geography']):
-                        message = "I can't answer geography questions, but I can help you fly to any capital city!"
-                    else:
-                        message = classification["suggestion"]
+                    tokens = _tokenize(query.lower())
+                    message = next(
+                        (msg for keywords, msg in _GENERAL_MESSAGES if not keywords.isdisjoint(tokens)),
+                        classification["suggestion"]
+                    )
 
                     return {
                         "error": "general_query",
@@ -1140,296 +1725,159 @@ class SimpleOpenAIHandler:
                         "suggestions": self.get_smart_suggestions(query)
                     }
 
-            system_prompt = """
-            You are a flight search assistant. Extract flight search parameters from user queries.
-
-            IMPORTANT: Handle spelling mistakes intelligently. Common misspellings to recognize:
-            - "tommorow", "tommorrow", "tomorow", "tomorrrow", "tomarow" = "tomorrow"
-            - "deli", "dehli" = "Delhi"
-            - "mumbay", "bombay" = "Mumbai"
-            - "bangalor", "banglore" = "Bangalore"
-            - "chenai", "channai" = "Chennai"
-            - "kochi", "cochin" = "Kochi"
-
-            Return ONLY valid JSON with these fields:
-            {
-                "origin": "airport_code",
-                "destination": "airport_code",
-                "departure_date": "YYYY-MM-DD",
-                "passengers": 1,
-                "cabin_class": "ECONOMY",
-                "filters": {
-                    "direct_only": false,
-                    "specific_airlines": [],
-                    "max_price": null,
-                    "preferred_times": [],
-                    "exclude_airlines": [],
-                    "max_stops": null,
-                    "preferred_airlines": []
-                }
-            }
-
-            Airport codes:
-            Delhi=DEL, Mumbai=BOM, Bangalore=BLR, Chennai=MAA, Kolkata=CCU,
-            Hyderabad=HYD, Pune=PNQ, Ahmedabad=AMD, Kochi=COK, Goa=GOI
-
-            For dates (today is 2025-07-04):
-            - "tomorrow" or any misspelling = 2025-07-05
-            - "today" = 2025-07-04
-            - "next week" = 2025-07-11
-            - "August 18" = 2025-08-18
-            - "next month" = 2025-08-15
-
-            CABIN CLASS DETECTION (CRITICAL):
-            - ALWAYS check the entire query for cabin class keywords FIRST
-            - If ANY of these words appear: "business class", "business", "business cabin", "premium economy", "premium", "business only", "only business" = set "cabin_class": "BUSINESS"
-            - If ANY of these words appear: "first class", "first", "luxury", "first only", "only first" = set "cabin_class": "FIRST"
-            - If ANY of these words appear: "economy class", "economy", "coach", "economy only", "only economy" = set "cabin_class": "ECONOMY"
-            - If user says "show only business class" or "business class only" = MUST set "cabin_class": "BUSINESS"
-            - If user says "show only economy class" or "economy class only" = MUST set "cabin_class": "ECONOMY"
-            - Default to "ECONOMY" ONLY if NO cabin class keywords are found
-            - IMPORTANT: When user explicitly requests a specific class, prioritize that over default
-
-            ADVANCED FILTERS DETECTION:
-            - "direct flights only", "direct only", "non-stop only", "no stops", "direct flights" = set "filters.direct_only": true
-            - "show only direct flights" = set "filters.direct_only": true
-            - "I want direct flights" = set "filters.direct_only": true
-            - "only Air India", "Air India only", "show Air India flights" = set "filters.specific_airlines": ["Air India"]
-            - "IndiGo flights only", "only IndiGo" = set "filters.specific_airlines": ["IndiGo"]
-            - "Vistara flights", "show Vistara" = set "filters.specific_airlines": ["Vistara"]
-            - "SpiceJet only", "only SpiceJet flights" = set "filters.specific_airlines": ["SpiceJet"]
-            - "GoAir flights", "Go First flights" = set "filters.specific_airlines": ["Go First"]
-            - "under 5000", "less than 5000", "cheaper than 5000" = set "filters.max_price": 5000
-            - "under 10000 rupees", "less than 10000" = set "filters.max_price": 10000
-            - "morning flights", "early morning", "before 10 AM" = set "filters.preferred_times": ["morning"]
-            - "evening flights", "after 6 PM", "night flights" = set "filters.preferred_times": ["evening"]
-            - "afternoon flights", "between 12 PM and 6 PM" = set "filters.preferred_times": ["afternoon"]
-            - "no Air India", "exclude Air India" = set "filters.exclude_airlines": ["Air India"]
-            - "not IndiGo", "exclude IndiGo" = set "filters.exclude_airlines": ["IndiGo"]
-            - "maximum 1 stop", "max 1 stop", "1 stop maximum" = set "filters.max_stops": 1
-            - "no stops", "non-stop", "direct" = set "filters.max_stops": 0
-            - "prefer Air India", "preferably Air India" = set "filters.preferred_airlines": ["Air India"]
-            - "prefer IndiGo", "preferably IndiGo" = set "filters.preferred_airlines": ["IndiGo"]
-
-            SPECIAL HANDLING:
-            - If query has cities but NO date mentioned, omit "departure_date" from response
-            - If you cannot extract origin/destination, return {"error": "missing_location"}
-            - Examples of queries without dates: "find flights for Delhi to Mumbai", "flights from Chennai to Kochi"
-            - ALWAYS check for cabin class keywords in the query and set cabin_class accordingly
-            - ALWAYS check for filter keywords and set appropriate filters
-            
-            EXAMPLES:
-            - "direct flights from Delhi to Mumbai" → {"filters": {"direct_only": true}}
-            - "show only Air India flights" → {"filters": {"specific_airlines": ["Air India"]}}
-            - "flights under 5000 rupees" → {"filters": {"max_price": 5000}}
-            - "morning flights only" → {"filters": {"preferred_times": ["morning"]}}
-            - "no Air India flights" → {"filters": {"exclude_airlines": ["Air India"]}}
-            - "maximum 1 stop" → {"filters": {"max_stops": 1}}
-            - "prefer IndiGo" → {"filters": {"preferred_airlines": ["IndiGo"]}}
-            - "business class direct flights only" → {"cabin_class": "BUSINESS", "filters": {"direct_only": true}}
-            """
-
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0.1,
-                max_tokens=200
-            )
-
-            content = response.choices[0].message.content.strip()
-
-            # Clean up response (remove markdown formatting if present)
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-
-            params = json.loads(content)
-
-            # If OpenAI couldn't extract locations, return error
-            if "error" in params:
-                return params
+                # Flight-related but too vague to parse (e.g. "book a flight"): ask for the route without calling OpenAI
+                if _lacks_flight_details(query.lower()):
+                    self.logger.info("🔍 Query has no route, airline or date details, skipping OpenAI: '%s'", query)
+                    return {
+                        "error": "missing_location",
+                        "message": "Please tell me where you're flying from and to, e.g. 'flights from Delhi to Mumbai tomorrow'."
+                    }
 
             # Always enhance date parsing with our custom parser for better accuracy
             custom_date = self.date_parser.parse_date(query)
-            
-            # Check for date ranges first
             date_range = self.date_parser.parse_date_range(query)
-            if date_range and date_range["type"] == "date_range":
-                # For date ranges, use the start date as departure date
-                # The end date represents the range end, not a return flight
-                params["departure_date"] = date_range["start_date"]
-                params["date_range_end"] = date_range["end_date"]  # Store for potential future use
-                logger.info(f"🔍 Date range detected: {date_range['start_date']} to {date_range['end_date']} (using start date for departure)")
-            else:
-                logger.info(f"🔍 Date validation starting: OpenAI={params.get('departure_date', 'None')}, Custom={custom_date}, Query='{query}'")
 
-            # If OpenAI provided a date, check if it's reasonable
-            if "departure_date" in params and params["departure_date"]:
-                logger.info(f"🔍 OpenAI provided date: {params['departure_date']}")
-                try:
-                    openai_date = datetime.strptime(params["departure_date"], "%Y-%m-%d")
-                    today = datetime.now()
+            params = await self._chat_json("params", SYSTEM_PROMPT, query)
 
-                    # Only validate against custom date if custom parser found a date
-                    if custom_date:
-                        custom_date_obj = datetime.strptime(custom_date, "%Y-%m-%d")
-                    else:
-                        custom_date_obj = None
-
-                    # Check for specific relative date terms and validate accordingly
-                    query_lower = query.lower()
-                    should_use_custom = False
-
-                    tomorrow_variants = ['tomorrow', 'tommorow', 'tomorow', 'tommorrow', 'tomorrrow', 'tomorow', 'tomarow']
-                    if any(variant in query_lower for variant in tomorrow_variants):
-                        expected_date = today + timedelta(days=1)
-                        # If OpenAI date is not tomorrow, use custom parser
-                        if openai_date.date() != expected_date.date():
-                            should_use_custom = True
-                            logger.info(f"🔄 OpenAI date {params['departure_date']} incorrect for 'tomorrow', using custom parser: {custom_date}")
-
-                    elif 'next week' in query_lower:
-                        expected_date = today + timedelta(days=7)
-                        # Allow some flexibility for "next week" (5-9 days)
-                        if not (5 <= (openai_date - today).days <= 9):
-                            should_use_custom = True
-                            logger.info(f"🔄 OpenAI date {params['departure_date']} incorrect for 'next week', using custom parser: {custom_date}")
-
-                    elif 'next month' in query_lower and custom_date_obj:
-                        # Check if it's actually next month
-                        if openai_date.month != custom_date_obj.month or openai_date.year != custom_date_obj.year:
-                            should_use_custom = True
-                            logger.info(f"🔄 OpenAI date {params['departure_date']} incorrect for 'next month', using custom parser: {custom_date}")
-
-                    else:
-                        # For other cases, check if date is in the past or too far in future
-                        if openai_date < today or openai_date > today + timedelta(days=730):
-                            should_use_custom = True
-                            logger.info(f"🔄 OpenAI date {params['departure_date']} seems incorrect (past/too far), using custom parser: {custom_date}")
-
-                    if should_use_custom and custom_date:
-                        params["departure_date"] = custom_date
+            # If OpenAI couldn't extract locations, return error
+            if "error" in params:
+                return params
 
-                except Exception as e:
-                    logger.warning(f"Date parsing error: {e}, using custom parser")
-                    if custom_date:
-                        params["departure_date"] = custom_date
-            else:
-                logger.info(f"🔍 No OpenAI date provided, checking custom parser: {custom_date}")
-                if custom_date:
-                    params["departure_date"] = custom_date
+            self._reconcile_departure_date(query, params, custom_date, date_range)
 
             # 🔄 ENHANCED: Check if this is an incomplete query that needs context from previous search
             if user_id and db and not params.get("departure_date"):
-                logger.info(f"🔍 No date found in query, checking for previous search context...")
-                last_search = self.conversation_memory.get_last_flight_search(user_id, db)
+                logger.info("🔍 No date found in query, checking for previous search context...")
+                if last_search is _MISSING:
+                    last_search = self.conversation_memory.get_last_flight_search(user_id, db)
                 if last_search:
                     # Inherit date from previous search if current query has new route but no date
                     params["departure_date"] = last_search.get("departure_date")
                     params["is_follow_up"] = True
                     params["follow_up_type"] = "route_change_same_date"
                     params["inherited_date"] = True
-                    logger.info(f"🔄 Inherited date from previous search: {params['departure_date']}")
+                    logger.info("🔄 Inherited date from previous search: %s", params["departure_date"])
                 else:
                     # No previous search found, use default date (2 weeks from now)
-                    today = datetime.now()
-                    default_date = today + timedelta(days=14)
-                    params["departure_date"] = default_date.strftime("%Y-%m-%d")
-                    logger.info(f"🔄 No previous search found, using default date: {params['departure_date']}")
+                    params["departure_date"] = (date.today() + timedelta(days=14)).isoformat()
+                    logger.info("🔄 No previous search found, using default date: %s", params["departure_date"])
 
-            logger.info(f"📅 Final departure date: {params['departure_date']}")
+            logger.info("📅 Final departure date: %s", params["departure_date"])
 
             # Add follow-up metadata if this was a follow-up query requiring fresh extraction
             if follow_up_metadata is not None:
                 params.update(follow_up_metadata)
-                logger.info(f"🔄 Added follow-up metadata: {follow_up_metadata}")
+                logger.info("🔄 Added follow-up metadata: %s", follow_up_metadata)
             
             # Special handling for filter-only follow-ups
-            if params.get("follow_up_type") == "filter_change_same_route":
-                # Extract filters from the original query using OpenAI
-                logger.info(f"🔄 Processing filter-only follow-up: {query}")
+            if params.get("follow_up_type") == "filter_change_same_route" and params.get("filters"):
+                # The main prompt already returns filters and cabin class, so no second extraction is needed
+                logger.info("🔄 Using filters from main extraction for follow-up: %s", params["filters"])
+            elif params.get("follow_up_type") == "filter_change_same_route":
+                # Extract filters from the original query only when the main response lacked them
+                logger.info("🔄 Processing filter-only follow-up: %s", query)
                 filter_params = await self._extract_filters_only(query)
-                logger.info(f"🔄 Filter extraction result: {filter_params}")
+                logger.info("🔄 Filter extraction result: %s", filter_params)
                 if filter_params:
                     params.update(filter_params)
-                    logger.info(f"🔄 Added filters from follow-up: {filter_params}")
+                    logger.info("🔄 Added filters from follow-up: %s", filter_params)
                 else:
-                    logger.warning(f"⚠️ No filters extracted from query: {query}")
+                    logger.warning("⚠️ No filters extracted from query: %s", query)
 
             return params
 
         except Exception as e:
-            logger.error(f"OpenAI extraction error: {e}")
+            logger.error("OpenAI extraction error: %s", e)
             return {"error": f"openai_error: {str(e)}"}
 
+    async def parse_queries_bulk(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """Extract flight parameters for many queries (batch imports, replays) with one OpenAI call per batch.
+
+        Follow-up context is not applied; each result gets the same date validation as extract_flight_params.
+        """
+        results = []
+        for start in range(0, len(queries), BULK_BATCH_SIZE):
+            batch = queries[start:start + BULK_BATCH_SIZE]
+            try:
+                batch_params = await self._chat_json_batch(batch)
+            except Exception as e:
+                logger.error(f"Bulk extraction error: {e}")
+                results.extend({"error": f"openai_error: {str(e)}"} for _ in batch)
+                continue
+
+            for query, params in zip(batch, batch_params):
+                if "error" not in params:
+                    self._reconcile_departure_date(
+                        query, params,
+                        self.date_parser.parse_date(query),
+                        self.date_parser.parse_date_range(query)
+                    )
+                results.append(params)
+
+        return results
+
+    def _reconcile_departure_date(self, query: str, params: Dict[str, Any],
+                                  custom_date: Optional[str], date_range: Optional[Dict[str, Any]]) -> None:
+        """Check OpenAI's departure date against the local date parser and fix it in place"""
+        # Check for date ranges first
+        if date_range and date_range["type"] == "date_range":
+            # For date ranges, use the start date as departure date
+            # The end date represents the range end, not a return flight
+            params["departure_date"] = date_range["start_date"]
+            params["date_range_end"] = date_range["end_date"]  # Store for potential future use
+            logger.info("🔍 Date range detected: %s to %s (using start date for departure)",
+                        date_range["start_date"], date_range["end_date"])
+        else:
+            logger.info("🔍 Date validation starting: OpenAI=%s, Custom=%s, Query='%s'",
+                        params.get("departure_date", "None"), custom_date, query)
+
+        # If OpenAI provided a date, check if it's reasonable
+        if "departure_date" in params and params["departure_date"]:
+            logger.info("🔍 OpenAI provided date: %s", params["departure_date"])
+            try:
+                openai_date = _parse_iso_date(params["departure_date"])
+                today = date.today()
+
+                # Only validate against custom date if custom parser found a date
+                if custom_date:
+                    custom_date_obj = _parse_iso_date(custom_date)
+                else:
+                    custom_date_obj = None
+
+                # One scan for a relative date term, then that term's check (or the plain range check)
+                match = _REL_DATE_RE.search(query.lower())
+                if match:
+                    should_use_custom = _REL_HANDLERS[match.lastgroup](today, openai_date, custom_date_obj)
+                else:
+                    should_use_custom = _date_out_of_range(today, openai_date)
+
+                if should_use_custom:
+                    logger.info("🔄 OpenAI date %s incorrect for '%s', using custom parser: %s",
+                                params["departure_date"], match.group(0) if match else "past/too far", custom_date)
+                    if custom_date:
+                        params["departure_date"] = custom_date
+
+            except Exception as e:
+                logger.warning("Date parsing error: %s, using custom parser", e)
+                if custom_date:
+                    params["departure_date"] = custom_date
+        else:
+            logger.info("🔍 No OpenAI date provided, checking custom parser: %s", custom_date)
+            if custom_date:
+                params["departure_date"] = custom_date
+
     async def _extract_filters_only(self, query: str) -> Dict[str, Any]:
         """Extract only filters from a query (for follow-up filter changes)"""
         try:
             logger.info(f"🔄 Starting filter extraction for query: '{query}'")
-            
-            system_prompt = """
-            You are a flight filter extraction assistant. Extract ONLY filters from the user query.
-            
-            Return ONLY valid JSON with these fields:
-            {
-                "filters": {
-                    "direct_only": false,
-                    "specific_airlines": [],
-                    "max_price": null,
-                    "preferred_times": [],
-                    "exclude_airlines": [],
-                    "max_stops": null,
-                    "preferred_airlines": []
-                },
-                "cabin_class": "ECONOMY"
-            }
-            
-            FILTER DETECTION:
-            - "air india flights only", "only air india" = specific_airlines: ["Air India"]
-            - "indigo flights only", "only indigo" = specific_airlines: ["IndiGo"]
-            - "vistara flights", "only vistara" = specific_airlines: ["Vistara"]
-            - "spicejet only", "only spicejet" = specific_airlines: ["SpiceJet"]
-            - "direct flights only", "direct only", "non-stop only" = direct_only: true
-            - "under 5000", "less than 5000" = max_price: 5000
-            - "morning flights", "early morning" = preferred_times: ["morning"]
-            - "evening flights", "night flights" = preferred_times: ["evening"]
-            - "no air india", "exclude air india" = exclude_airlines: ["Air India"]
-            - "maximum 1 stop", "max 1 stop" = max_stops: 1
-            - "prefer air india", "preferably air india" = preferred_airlines: ["Air India"]
-            
-            CABIN CLASS DETECTION:
-            - "business class", "business" = cabin_class: "BUSINESS"
-            - "economy class", "economy" = cabin_class: "ECONOMY"
-            - "first class", "first" = cabin_class: "FIRST"
-            
-            Return ONLY the JSON, no other text.
-            """
-
-            logger.info(f"🔄 Making OpenAI API call for filter extraction")
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                temperature=0.1,
-                max_tokens=200
-            )
 
-            content = response.choices[0].message.content.strip()
-            logger.info(f"🔄 OpenAI response: {content}")
-            
-            # Clean up response
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
+            # Common phrasings are recognised locally; only unfamiliar ones go to OpenAI
+            result = _match_filters(query.lower())
+            if result is not None:
+                logger.info(f"🔄 Extracted filters locally: {result}")
+                return result
 
-            result = json.loads(content)
+            result = await self._chat_json("filter", FILTER_SYSTEM_PROMPT, query, FILTER_MAX_TOKENS)
             logger.info(f"🔄 Extracted filters: {result}")
             return result
 
@@ -1442,11 +1890,20 @@ class SimpleOpenAIHandler:
 class CurrencyConverter:
     """Simple currency converter for EUR to INR"""
 
+    RATE_CACHE_TTL_SECONDS = 900  # Reuse a fetched live rate for 15 minutes
+    RATE_RETRY_SECONDS = 60  # After a failed fetch, use the fallback rate this long before retrying
+
     def __init__(self):
         self.eur_to_inr_rate = 89.5  # Approximate rate, can be updated
+        self._rate_cache = (None, 0.0)  # (rate, monotonic expiry)
 
     def get_live_rate(self) -> float:
         """Get live EUR to INR exchange rate"""
+        rate, expires_at = self._rate_cache
+        now = time.monotonic()
+        if rate and now < expires_at:
+            return rate
+
         try:
             # Using a free API for exchange rates
             response = requests.get(
@@ -1455,10 +1912,13 @@ class CurrencyConverter:
             )
             if response.status_code == 200:
                 data = response.json()
-                return data.get("rates", {}).get("INR", self.eur_to_inr_rate)
+                rate = data.get("rates", {}).get("INR", self.eur_to_inr_rate)
+                self._rate_cache = (rate, now + self.RATE_CACHE_TTL_SECONDS)
+                return rate
         except Exception as e:
             logger.warning(f"Could not fetch live exchange rate: {e}")
 
+        self._rate_cache = (self.eur_to_inr_rate, now + self.RATE_RETRY_SECONDS)
         return self.eur_to_inr_rate
 
     def convert_eur_to_inr(self, eur_amount: float, use_live_rate: bool = True) -> Dict[str, Any]:
@@ -1478,59 +1938,143 @@ class CurrencyConverter:
             "formatted_eur": f"€{eur_amount:.2f}"
         }
 
+# Carrier code to airline name, for formatting Amadeus offers (read-only)
+_AIRLINE_MAP = MappingProxyType({
+    "AI": "Air India",
+    "6E": "IndiGo",
+    "UK": "Vistara",
+    "SG": "SpiceJet",
+    "G8": "Go First",
+    "9W": "Jet Airways",
+    "I5": "AirAsia India",
+    "QP": "Akasa Air",
+    "EM": "Emirates",
+    "EK": "Emirates",
+    "QR": "Qatar Airways",
+    "TK": "Turkish Airlines",
+    "LH": "Lufthansa",
+    "BA": "British Airways",
+    "AF": "Air France",
+    "KL": "KLM",
+    "DL": "Delta Air Lines",
+    "AA": "American Airlines",
+    "UA": "United Airlines",
+    "CA": "Air China",
+    "MU": "China Eastern",
+    "CZ": "China Southern",
+    "NH": "All Nippon Airways",
+    "JL": "Japan Airlines",
+    "KE": "Korean Air",
+    "OZ": "Asiana Airlines",
+    "TG": "Thai Airways",
+    "SQ": "Singapore Airlines",
+    "MH": "Malaysia Airlines",
+    "GA": "Garuda Indonesia",
+    "PR": "Philippine Airlines",
+    "VN": "Vietnam Airlines",
+    "LA": "LATAM",
+    "JJ": "LATAM Brasil",
+    "AV": "Avianca",
+    "CM": "Copa Airlines",
+    "AM": "Aeromexico",
+    "AC": "Air Canada",
+    "WS": "WestJet",
+    "QZ": "Indonesia AirAsia",
+    "FD": "Thai AirAsia",
+    "AK": "AirAsia",
+    "D7": "AirAsia X",
+    "TR": "Tigerair",
+    "JQ": "Jetstar",
+    "VA": "Virgin Australia",
+    "QF": "Qantas",
+    "NZ": "Air New Zealand",
+    "FJ": "Fiji Airways",
+    "PG": "Bangkok Airways",
+    "VZ": "Thai VietJet Air",
+    "VJ": "VietJet Air",
+    "BL": "Pacific Airlines",
+    "VU": "Vueling",
+    "FR": "Ryanair",
+    "U2": "easyJet",
+    "W6": "Wizz Air",
+    "DY": "Norwegian Air Shuttle",
+    "SK": "SAS",
+    "AY": "Finnair",
+    "LO": "LOT Polish Airlines",
+    "OS": "Austrian Airlines",
+    "LX": "Swiss International Air Lines",
+    "SN": "Brussels Airlines",
+    "TP": "TAP Air Portugal",
+    "IB": "Iberia",
+    "AZ": "ITA Airways",
+    "SU": "Aeroflot",
+    "S7": "S7 Airlines",
+    "U6": "Ural Airlines",
+    "FV": "Rossiya Airlines",
+    "DP": "Pobeda",
+    "UT": "UTair",
+    "N4": "Nordwind Airlines",
+    "7G": "Starflyer"
+})
+
+# Amadeus ISO timestamp, e.g. "2025-08-19T08:00:00" -> date, HH:MM
+_ISO_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2})')
+
+# Fields every Amadeus segment must carry for formatting
+_EXPECTED_KEYS = ('carrierCode', 'number', 'departure', 'arrival')
+_ENDPOINT_KEYS = ('iataCode', 'at')
+
+
+def _is_valid_segment(segment: Dict) -> bool:
+    """Check that a segment has the fields the formatter indexes directly"""
+    return (
+        all(key in segment for key in _EXPECTED_KEYS)
+        and all(key in segment["departure"] for key in _ENDPOINT_KEYS)
+        and all(key in segment["arrival"] for key in _ENDPOINT_KEYS)
+    )
+
+
 class SimpleFlightFormatter:
     """Simple flight data formatter with currency conversion"""
 
     def __init__(self):
         self.currency_converter = CurrencyConverter()
     
+    @staticmethod
+    def _safe_extract_datetime(timestamp: str) -> Tuple[str, str]:
+        """Safely extract (date, time) from a timestamp in one pass"""
+        if not timestamp or not isinstance(timestamp, str):
+            return "N/A", "N/A"
+
+        # Handle ISO format: "2025-08-19T08:00:00"
+        match = _ISO_RE.match(timestamp)
+        if match:
+            return match.group(1), match.group(2)
+
+        # Handle other formats - return as is
+        return timestamp, timestamp
+
     def _safe_extract_time(self, time_string: str) -> str:
         """Safely extract time from various formats"""
-        try:
-            if not time_string:
-                return "N/A"
-            
-            # Handle ISO format: "2025-08-19T08:00:00"
-            if "T" in time_string and len(time_string) >= 16:
-                return time_string[11:16]  # Extract HH:MM
-            
-            # Handle other formats - return as is
-            return time_string
-        except Exception as e:
-            logger.warning(f"Error extracting time from '{time_string}': {e}")
-            return "N/A"
-    
+        return self._safe_extract_datetime(time_string)[1]
+
     def _safe_extract_date(self, date_string: str) -> str:
         """Safely extract date from various formats"""
-        try:
-            if not date_string:
-                return "N/A"
-            
-            # Handle ISO format: "2025-08-19T08:00:00"
-            if "T" in date_string and len(date_string) >= 10:
-                return date_string[:10]  # Extract YYYY-MM-DD
-            
-            # Handle other formats - return as is
-            return date_string
-        except Exception as e:
-            logger.warning(f"Error extracting date from '{date_string}': {e}")
-            return "N/A"
+        return self._safe_extract_datetime(date_string)[0]
 
     def format_amadeus_response(self, amadeus_data: List[Dict], requested_cabin_class: str = None) -> List[Dict[str, Any]]:
         """Format Amadeus API response to simple structure with INR conversion and cabin class filtering"""
         flights = []
         
-        logger.info(f"🔍 Formatting flights with requested cabin class: {requested_cabin_class}")
+        logger.info("🔍 Formatting %d flights with requested cabin class: %s", len(amadeus_data), requested_cabin_class)
+        # Checked once: per-offer debug lines are skipped entirely unless debug logging is on
+        log_skips = logger.isEnabledFor(logging.DEBUG)
+
+        # Fetch the exchange rate once for the whole response
+        rate = self.currency_converter.get_live_rate()
 
         for offer in amadeus_data:
             try:
-                itinerary = offer["itineraries"][0]
-                segment = itinerary["segments"][0]
-
-                # Convert price to INR
-                eur_price = float(offer['price']['total'])
-                currency_info = self.currency_converter.convert_eur_to_inr(eur_price)
-
                 # Extract cabin class from travelerPricings (more reliable than segment data)
                 cabin_class = "ECONOMY"  # Default
                 try:
@@ -1540,13 +2084,27 @@ class SimpleFlightFormatter:
                             fare_details = traveler_pricing["fareDetailsBySegment"][0]
                             cabin_class = fare_details.get("cabin", "ECONOMY")
                 except Exception as e:
-                    logger.debug(f"Could not extract cabin class, using default: {e}")
+                    logger.debug("Could not extract cabin class, using default: %s", e)
                 
-                # Filter by requested cabin class if specified
+                # Filter by requested cabin class before doing any formatting work
                 if requested_cabin_class and cabin_class != requested_cabin_class:
-                    logger.debug(f"🔍 Skipping flight with cabin class {cabin_class} (requested: {requested_cabin_class})")
+                    if log_skips:
+                        logger.debug("🔍 Skipping flight with cabin class %s (requested: %s)", cabin_class, requested_cabin_class)
                     continue
 
+                itinerary = offer["itineraries"][0]
+                segments = itinerary["segments"]
+
+                # Validate segment shape once so the builders below can index directly
+                if not segments or not all(_is_valid_segment(seg) for seg in segments):
+                    logger.warning("⚠️ Skipping offer %s with malformed segments", offer.get("id", "?"))
+                    continue
+                segment = segments[0]
+
+                # Convert price to INR
+                eur_price = float(offer['price']['total'])
+                inr_price = eur_price * rate
+
                 # Extract additional flight details
                 aircraft = segment.get("aircraft", {}).get("code", "N/A")
                 departure_terminal = segment.get("departure", {}).get("terminal", "N/A")
@@ -1560,13 +2118,12 @@ class SimpleFlightFormatter:
                 departure_at = segment["departure"]["at"]
                 arrival_at = segment["arrival"]["at"]
                 
-                departure_date = self._safe_extract_date(departure_at)
-                departure_time = self._safe_extract_time(departure_at)
-                arrival_date = self._safe_extract_date(arrival_at)
-                arrival_time = self._safe_extract_time(arrival_at)
+                departure_date, departure_time = self._safe_extract_datetime(departure_at)
+                arrival_date, arrival_time = self._safe_extract_datetime(arrival_at)
                 
                 # Extract airline name from carrier code
                 airline_name = self._get_airline_name(segment["carrierCode"])
+                formatted_segments = self._format_segments(segments)
                 
                 flight = {
                     "flight_number": f"{segment['carrierCode']}{segment['number']}",
@@ -1581,179 +2138,70 @@ class SimpleFlightFormatter:
                     "departure_terminal": departure_terminal,
                     "arrival_terminal": arrival_terminal,
                     "duration": itinerary["duration"],
-                    "price": currency_info["formatted_inr"],  # Primary price in INR
-                    "price_eur": currency_info["formatted_eur"],  # Original EUR price
-                    "price_numeric": currency_info["inr_amount"],  # Numeric INR for sorting
+                    "price": f"₹{inr_price:,.0f}",  # Primary price in INR
+                    "price_eur": f"€{eur_price:.2f}",  # Original EUR price
+                    "price_numeric": round(inr_price, 2),  # Numeric INR for sorting
                     "price_eur_numeric": eur_price,  # Original EUR numeric
                     "currency": "INR",
-                    "exchange_rate": currency_info["exchange_rate"],
+                    "exchange_rate": rate,
                     "cabin_class": cabin_class,  # Use properly extracted cabin class
                     "booking_class": cabin_class,  # Alias for frontend compatibility
                     "aircraft": aircraft,
                     "operating_carrier": operating_carrier,
                     "route": route,
-                    "stops": len(itinerary["segments"]) - 1,
-                    "is_direct": len(itinerary["segments"]) == 1,
-                    "segments": self._format_segments(itinerary["segments"])
+                    "stops": len(segments) - 1,
+                    "is_direct": len(segments) == 1,
+                    "segments": formatted_segments
                 }
 
                 # Add connecting flights information if there are multiple segments
-                if len(itinerary["segments"]) > 1:
-                    connecting_flights = []
-                    for i, seg in enumerate(itinerary["segments"]):
-                        try:
-                            # Safely extract departure and arrival times
-                            departure_at = seg.get("departure", {}).get("at", "")
-                            arrival_at = seg.get("arrival", {}).get("at", "")
-                            
-                            departure_time = self._safe_extract_time(departure_at)
-                            arrival_time = self._safe_extract_time(arrival_at)
-                            
-                            connecting_flights.append({
-                                "segment": i + 1,
-                                "flight_number": f"{seg['carrierCode']}{seg['number']}",
-                                "departure": f"{seg['departure']['iataCode']} {departure_time}",
-                                "arrival": f"{seg['arrival']['iataCode']} {arrival_time}",
-                                "duration": seg.get("duration", "N/A")
-                            })
-                        except Exception as e:
-                            logger.warning(f"Error formatting connecting flight segment {i+1}: {e}")
-                            # Add a fallback entry
-                            connecting_flights.append({
-                                "segment": i + 1,
-                                "flight_number": f"{seg.get('carrierCode', 'N/A')}{seg.get('number', 'N/A')}",
-                                "departure": f"{seg.get('departure', {}).get('iataCode', 'N/A')} N/A",
-                                "arrival": f"{seg.get('arrival', {}).get('iataCode', 'N/A')} N/A",
-                                "duration": seg.get("duration", "N/A")
-                            })
-                    flight["connecting_flights"] = connecting_flights
+                if len(segments) > 1:
+                    flight["connecting_flights"] = [
+                        {
+                            "segment": i,
+                            "flight_number": f"{seg['carrier']['code']}{raw['number']}",
+                            "departure": f"{seg['departure']['airport']} {seg['departure']['time']}",
+                            "arrival": f"{seg['arrival']['airport']} {seg['arrival']['time']}",
+                            "duration": seg["duration"]
+                        }
+                        # Reuse the formatted segments so each timestamp is parsed once
+                        for i, (raw, seg) in enumerate(zip(segments, formatted_segments), start=1)
+                    ]
 
                 flights.append(flight)
 
             except Exception as e:
-                logger.error(f"Flight formatting error: {e}")
+                logger.error("Flight formatting error: %s", e)
                 continue
 
         return flights
 
-    def _get_airline_name(self, carrier_code: str) -> str:
+    @staticmethod
+    def _get_airline_name(carrier_code: str) -> str:
         """Get airline name from carrier code"""
-        airline_map = {
-            "AI": "Air India",
-            "6E": "IndiGo",
-            "UK": "Vistara",
-            "SG": "SpiceJet",
-            "G8": "Go First",
-            "9W": "Jet Airways",
-            "I5": "AirAsia India",
-            "QP": "Akasa Air",
-            "EM": "Emirates",
-            "EK": "Emirates",
-            "QR": "Qatar Airways",
-            "TK": "Turkish Airlines",
-            "LH": "Lufthansa",
-            "BA": "British Airways",
-            "AF": "Air France",
-            "KL": "KLM",
-            "DL": "Delta Air Lines",
-            "AA": "American Airlines",
-            "UA": "United Airlines",
-            "CA": "Air China",
-            "MU": "China Eastern",
-            "CZ": "China Southern",
-            "NH": "All Nippon Airways",
-            "JL": "Japan Airlines",
-            "KE": "Korean Air",
-            "OZ": "Asiana Airlines",
-            "TG": "Thai Airways",
-            "SQ": "Singapore Airlines",
-            "MH": "Malaysia Airlines",
-            "GA": "Garuda Indonesia",
-            "PR": "Philippine Airlines",
-            "VN": "Vietnam Airlines",
-            "LA": "LATAM",
-            "JJ": "LATAM Brasil",
-            "AV": "Avianca",
-            "CM": "Copa Airlines",
-            "AM": "Aeromexico",
-            "AC": "Air Canada",
-            "WS": "WestJet",
-            "QZ": "Indonesia AirAsia",
-            "FD": "Thai AirAsia",
-            "AK": "AirAsia",
-            "D7": "AirAsia X",
-            "TR": "Tigerair",
-            "JQ": "Jetstar",
-            "VA": "Virgin Australia",
-            "QF": "Qantas",
-            "NZ": "Air New Zealand",
-            "FJ": "Fiji Airways",
-            "PG": "Bangkok Airways",
-            "VZ": "Thai VietJet Air",
-            "VJ": "VietJet Air",
-            "BL": "Pacific Airlines",
-            "VU": "Vueling",
-            "FR": "Ryanair",
-            "U2": "easyJet",
-            "W6": "Wizz Air",
-            "DY": "Norwegian Air Shuttle",
-            "SK": "SAS",
-            "AY": "Finnair",
-            "LO": "LOT Polish Airlines",
-            "OS": "Austrian Airlines",
-            "LX": "Swiss International Air Lines",
-            "SN": "Brussels Airlines",
-            "TP": "TAP Air Portugal",
-            "IB": "Iberia",
-            "AZ": "ITA Airways",
-            "SU": "Aeroflot",
-            "S7": "S7 Airlines",
-            "U6": "Ural Airlines",
-            "FV": "Rossiya Airlines",
-            "DP": "Pobeda",
-            "UT": "UTair",
-            "N4": "Nordwind Airlines",
-            "7G": "Starflyer"
-        }
-        return airline_map.get(carrier_code, carrier_code)
+        return _AIRLINE_MAP.get(carrier_code, carrier_code)
 
     def _format_segments(self, segments: List[Dict]) -> List[Dict]:
-        """Format segments for filtering"""
-        formatted_segments = []
-        
-        for segment in segments:
-            try:
-                # Extract airline name
-                airline_name = self._get_airline_name(segment["carrierCode"])
-                
-                # Get departure and arrival times
-                departure_time = self._safe_extract_time(segment["departure"]["at"])
-                arrival_time = self._safe_extract_time(segment["arrival"]["at"])
-                
-                formatted_segment = {
-                    "carrier": {
-                        "code": segment["carrierCode"],
-                        "name": airline_name
-                    },
-                    "departure": {
-                        "airport": segment["departure"]["iataCode"],
-                        "time": departure_time,
-                        "terminal": segment["departure"].get("terminal", "N/A")
-                    },
-                    "arrival": {
-                        "airport": segment["arrival"]["iataCode"],
-                        "time": arrival_time,
-                        "terminal": segment["arrival"].get("terminal", "N/A")
-                    },
-                    "stops": segment.get("numberOfStops", 0),
-                    "duration": segment.get("duration", "N/A"),
-                    "aircraft": segment.get("aircraft", {}).get("code", "N/A")
-                }
-                
-                formatted_segments.append(formatted_segment)
-                
-            except Exception as e:
-                logger.warning(f"Error formatting segment: {e}")
-                continue
-        
-        return formatted_segments
+        """Format segments for filtering (segments are validated by the caller)"""
+        return [
+            {
+                "carrier": {
+                    "code": segment["carrierCode"],
+                    "name": self._get_airline_name(segment["carrierCode"])
+                },
+                "departure": {
+                    "airport": segment["departure"]["iataCode"],
+                    "time": self._safe_extract_time(segment["departure"]["at"]),
+                    "terminal": segment["departure"].get("terminal", "N/A")
+                },
+                "arrival": {
+                    "airport": segment["arrival"]["iataCode"],
+                    "time": self._safe_extract_time(segment["arrival"]["at"]),
+                    "terminal": segment["arrival"].get("terminal", "N/A")
+                },
+                "stops": segment.get("numberOfStops", 0),
+                "duration": segment.get("duration", "N/A"),
+                "aircraft": segment.get("aircraft", {}).get("code", "N/A")
+            }
+            for segment in segments
+        ]